@@ -0,0 +1,194 @@
+# accelerator.py
+#
+# Loop fast-forwarding for CPU.run(accelerate=True). Two loop shapes are
+# recognised at runtime and skipped in closed form:
+#
+#   idle loop       BO #-2 (or BA back to itself) whose condition holds
+#
+#   counted loop    SUB rA, #k
+#                   SET rA
+#                   BO.P #-6 / BO.NZ #-6 (or BA back to the SUB)
+#
+# The loop body is re-read from memory every time, so self-modifying code is
+# handled, and whenever a precondition does not hold fast_forward() returns 0
+# and the instruction is executed normally. The resulting state is bit
+# identical to plain execution, including the sticky C/V flag behaviour of
+# the CPU; `python accelerator.py` checks that against random loops.
+
+import random
+import sys
+
+import cpu
+import isa
+
+# Opcodes that can start an accelerated loop (SUB, BO*, BA*)
+LOOP_HEADS = (0x9, 0xE, 0xF)
+
+COND_NZ = 2
+COND_P = 6
+
+def decode_branch(instruction):
+  """(condition, is_branch_offset, imm8) of a BO*/BA* word, or None for anything else."""
+  spec, operands = isa.decode(instruction)
+  if spec is None or spec.condition is None:
+    return None
+  return spec.condition, spec.name.startswith('BO'), operands[0]
+
+def branch_target(machine, branch, pc):
+  """Target of the decoded branch at pc, or None if it would raise."""
+  _, is_branch_offset, imm8 = branch
+  if imm8 & 0x1:
+    return None
+  if is_branch_offset:
+    target = pc + 2 + imm8
+    if target > 0xFFFF or target < 0x0000:
+      return None
+    return target
+  return machine.io + imm8
+
+def condition_holds(machine, condition):
+  mask, expected = isa.CONDITION_TESTS[condition]
+  return machine.fl & mask == expected
+
+def fast_forward(machine, instruction, ttl):
+  """Skip ahead over a recognised loop at machine.pc; returns the instructions skipped (0 if none)."""
+  opcode = instruction >> 12
+  if opcode == 0x9:
+    return _counted_loop(machine, instruction, ttl)
+  if opcode in (0xE, 0xF):
+    return _idle_loop(machine, instruction, ttl)
+  return 0
+
+def _idle_loop(machine, instruction, ttl):
+  pc = machine.pc
+  branch = decode_branch(instruction)
+  # plain execution halts as soon as PC passes 0xFFF4
+  if branch is None or pc > 0xFFF4 or branch_target(machine, branch, pc) != pc:
+    return 0
+  if not condition_holds(machine, branch[0]):
+    return 0
+  # nothing changes between iterations: burn the remaining ttl
+  return ttl
+
+def _counted_loop(machine, instruction, ttl):
+  pc = machine.pc
+  spec, operands = isa.decode(instruction)
+  if spec is None or spec.name != 'SUB' or pc + 6 > 0xFFF4:
+    return 0
+  ra, (is_imm, k) = operands
+  if not is_imm or ra in (0xE, 0xF):
+    return 0
+  k &= 0x3F  # imm6 is zero-extended
+
+  if machine.read_word(pc + 2) != isa.encode('SET', ra):
+    return 0
+  branch = decode_branch(machine.read_word(pc + 4))
+  if branch is None or (not branch[1] and ra == 0xB):  # BA* relative to a changing IO
+    return 0
+  if branch_target(machine, branch, pc + 4) != pc:
+    return 0
+  condition = branch[0]
+
+  x = machine.registers[ra]
+  if condition == COND_P:
+    if not 1 <= x <= 0x7FFF:
+      return 0
+  elif condition == COND_NZ:
+    if x == 0 or (k and x % k):
+      return 0
+  else:
+    return 0
+
+  # iterations until the branch falls through; a zero step never exits
+  iterations = (x + k - 1) // k if k else None
+  run = ttl // 3
+  if iterations is not None and iterations < run:
+    run = iterations
+  if run < 1:
+    return 0
+
+  result = x - run * k
+  # every SUB before the last one leaves a positive result, so only the last
+  # one sets C; V is set once when a BO.NZ countdown crosses 0x8000
+  if run == iterations:
+    machine.c = 1
+  if x >= 0x8000 and result < 0x8000:
+    machine.v = 1
+  machine.registers[ra] = result & 0xFFFF
+  machine.set_flags(machine.registers[ra])
+  machine.pc = pc + 6 if run == iterations else pc
+  return 3 * run
+
+def snapshot(machine):
+  return list(machine.registers), bytes(machine.memory)
+
+def differential_run(image, ttl=None, setup=None, breakpoints=None, **options):
+  """Run image plainly and with the run() options (default accelerate=True); returns a list of differences (empty if identical)."""
+  options = options or {'accelerate': True}
+  results = []
+  for fast in (False, True):
+    machine = cpu.CPU()
+    machine.load_image(image)
+    if setup:
+      setup(machine)
+    try:
+      stop = machine.run(ttl=ttl, breakpoints=breakpoints, **(options if fast else {}))
+      stop, error = repr(stop), None
+    except Exception as e:
+      stop, error = None, repr(e)
+    results.append((snapshot(machine), stop, error))
+
+  (plain_state, plain_stop, plain_err), (fast_state, fast_stop, fast_err) = results
+  differences = []
+  for i, (a, b) in enumerate(zip(plain_state[0], fast_state[0])):
+    if a != b:
+      differences.append(f"register {i}: plain 0x{a:04X} fast 0x{b:04X}")
+  if plain_state[1] != fast_state[1]:
+    differences.append("memory differs")
+  if plain_stop != fast_stop:
+    differences.append(f"stop differs: {plain_stop} vs {fast_stop}")
+  if plain_err != fast_err:
+    differences.append(f"exception differs: {plain_err} vs {fast_err}")
+  return differences
+
+def random_loop_program(rng):
+  """Random program around a counted or idle loop, plus a setup function for the initial state."""
+  import build
+
+  ra = rng.choice([0, 1, 2, 3, 7, 0xA, 0xB, 0xC, 0xD])
+  k = rng.choice([0, 1, 1, 2, 3, rng.randrange(64)])
+  condition = rng.choice([COND_P, COND_NZ, COND_P, 0, 1, 3, 5])
+  if rng.random() < 0.2:
+    loop = [0xE000 | (condition << 8) | 0xFE]  # branch to self
+  else:
+    loop = [0x9400 | (ra << 6) | k, 0xC000 | ra, 0xE000 | (condition << 8) | 0xFA]
+  # MVL IO, #0xF6 / MVH IO, #0xFF / BA #0 halts right after the loop
+  words = [0x0000] * rng.randrange(3) + loop + [0x4BF6, 0x5BFF, 0xF000]
+  values = [0, 1, 2, 3, 0x7FFF, 0x8000, 0xFFFF, rng.randrange(0x10000), rng.randrange(0x100)]
+  x = rng.choice(values)
+  if k and rng.random() < 0.3:
+    x = (x // k) * k
+  fl = rng.randrange(0x20)
+
+  def setup(machine):
+    machine.registers[ra] = x
+    machine.fl = fl
+
+  return build.words_to_image(words), setup
+
+if __name__ == "__main__":
+  # Differential test mode: plain and accelerated runs must agree exactly
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+  rng = random.Random(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+  failures = 0
+  for i in range(count):
+    image, setup = random_loop_program(rng)
+    ttl = rng.choice([1, 2, 3, 4, 5, 7, 100, 1000, rng.randrange(1, 0x2FFFF)])
+    differences = differential_run(image, ttl, setup)
+    if differences:
+      failures += 1
+      print(f"case {i}: image {image.hex()} ttl {ttl}")
+      for difference in differences:
+        print(f"  {difference}")
+  print(f"{count - failures}/{count} programs identical")
+  sys.exit(1 if failures else 0)
@@ -0,0 +1,168 @@
+# asmcov.py
+#
+# Source-line and branch coverage for assembly programs.
+#
+#   python cli.py run prog.txt --coverage run1.cov      # record (one file per run)
+#   python asmcov.py merge -o all.cov run*.cov          # optional
+#   python asmcov.py report run*.cov                    # per-file report
+#
+# A Coverage holds three 32K-bit bitmaps indexed by PC/2: executed
+# instructions and the taken / not-taken outcomes of BO*/BA* sites. Bitmaps
+# from any number of (parallel) runs are merged with a bitwise OR.
+
+import argparse
+import os
+import sys
+
+import build
+import cpu
+
+MAGIC = b'ASMCOV1\n'
+BITMAP_SIZE = 0x10000 // 2 // 8  # one bit per 16-bit word
+
+class Coverage:
+  def __init__(self, source=None, source_hash=None):
+    self.source = source
+    self.source_hash = source_hash
+    self.executed = bytearray(BITMAP_SIZE)
+    self.taken = bytearray(BITMAP_SIZE)
+    self.not_taken = bytearray(BITMAP_SIZE)
+
+  @classmethod
+  def for_source(cls, source):
+    """Empty coverage tied to an assembly source file."""
+    with open(source, 'rb') as file:
+      source_hash = build.source_hash(file.read())
+    return cls(os.path.abspath(source), source_hash)
+
+  def merge(self, other):
+    if (self.source, self.source_hash) != (other.source, other.source_hash):
+      raise ValueError(f"Cannot merge coverage of {other.source} into {self.source}")
+    for mine, theirs in ((self.executed, other.executed), (self.taken, other.taken), (self.not_taken, other.not_taken)):
+      merged = int.from_bytes(mine, 'little') | int.from_bytes(theirs, 'little')
+      mine[:] = merged.to_bytes(BITMAP_SIZE, 'little')
+
+  @staticmethod
+  def _bit(bitmap, address):
+    return (bitmap[address >> 4] >> ((address >> 1) & 0x7)) & 0x1
+
+  def is_executed(self, address):
+    return self._bit(self.executed, address)
+
+  def is_taken(self, address):
+    return self._bit(self.taken, address)
+
+  def is_not_taken(self, address):
+    return self._bit(self.not_taken, address)
+
+  def save(self, filename):
+    header = f"{self.source or ''}\n{self.source_hash or ''}\n".encode()
+    tmp = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as file:
+      file.write(MAGIC + header + self.executed + self.taken + self.not_taken)
+    os.replace(tmp, filename)
+
+  @classmethod
+  def load(cls, filename):
+    with open(filename, 'rb') as file:
+      data = file.read()
+    if not data.startswith(MAGIC):
+      raise ValueError(f"Not a coverage file: {filename}")
+    source, source_hash, bitmaps = data[len(MAGIC):].split(b'\n', 2)
+    if len(bitmaps) != 3 * BITMAP_SIZE:
+      raise ValueError(f"Truncated coverage file: {filename}")
+    coverage = cls(source.decode() or None, source_hash.decode() or None)
+    coverage.executed[:] = bitmaps[:BITMAP_SIZE]
+    coverage.taken[:] = bitmaps[BITMAP_SIZE:2*BITMAP_SIZE]
+    coverage.not_taken[:] = bitmaps[2*BITMAP_SIZE:]
+    return coverage
+
+def merge_files(filenames):
+  """Load and merge coverage files; returns {source: Coverage}."""
+  merged = {}
+  for filename in filenames:
+    coverage = Coverage.load(filename)
+    key = (coverage.source, coverage.source_hash)
+    if key in merged:
+      merged[key].merge(coverage)
+    else:
+      merged[key] = coverage
+  by_source = {}
+  for (source, _), coverage in merged.items():
+    if source in by_source:
+      raise ValueError(f"Coverage files recorded against different versions of {source}")
+    by_source[source] = coverage
+  return by_source
+
+def report_file(coverage, summary=False, out=sys.stdout):
+  """Print line and branch coverage of one source file; returns (lines hit, lines, outcomes hit, outcomes)."""
+  source = coverage.source
+  with open(source, 'rb') as file:
+    text = file.read()
+  if build.source_hash(text) != coverage.source_hash:
+    print(f"{source}: source changed since coverage was recorded, skipped", file=out)
+    return 0, 0, 0, 0
+
+  words = build.image_to_words(build.load_image(source))
+  line_map = build.load_debug_info(source)['lines']
+
+  line_hits = {}      # line -> executed?
+  line_branches = {}  # line -> [outcomes hit, outcomes]
+  for index, line in enumerate(line_map):
+    address = 2 * index
+    line_hits[line] = line_hits.get(line, False) or bool(coverage.is_executed(address))
+    word = words[index]
+    if word >> 13 == 0x7 and (word >> 8) & 0x7:  # conditional BO*/BA*
+      hit = coverage.is_taken(address) + coverage.is_not_taken(address)
+      branch = line_branches.setdefault(line, [0, 0])
+      branch[0] += hit
+      branch[1] += 2
+
+  lines_hit = sum(line_hits.values())
+  outcomes_hit = sum(hit for hit, _ in line_branches.values())
+  outcomes = sum(total for _, total in line_branches.values())
+
+  if not summary:
+    for number, line in enumerate(text.decode().splitlines(), 1):
+      if number not in line_hits:
+        marker, code = '    ', None
+      elif not line_hits[number]:
+        marker, code = '  - ', 31
+      elif number in line_branches and line_branches[number][0] < line_branches[number][1]:
+        marker, code = '  ~ ', 33
+      else:
+        marker, code = '  + ', None
+      listing = f"{number:5}{marker}{line}"
+      print(cpu.colored(listing, code) if code else listing, file=out)
+
+  line_pct = 100 * lines_hit / len(line_hits) if line_hits else 100
+  branch_pct = 100 * outcomes_hit / outcomes if outcomes else 100
+  print(f"{source}: lines {lines_hit}/{len(line_hits)} ({line_pct:.1f}%), "
+        f"branches {outcomes_hit}/{outcomes} ({branch_pct:.1f}%)", file=out)
+  return lines_hit, len(line_hits), outcomes_hit, outcomes
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='asmcov.py', description='assembly coverage reports')
+  commands = parser.add_subparsers(dest='command', required=True)
+  p = commands.add_parser('report', help='print per-file line and branch coverage')
+  p.add_argument('files', nargs='+')
+  p.add_argument('--summary', action='store_true', help='only print the per-file totals')
+  p.add_argument('--no-color', dest='color', action='store_false', default=None)
+  p = commands.add_parser('merge', help='merge coverage files of the same source')
+  p.add_argument('files', nargs='+')
+  p.add_argument('-o', '--output', required=True)
+  args = parser.parse_args(argv)
+
+  merged = merge_files(args.files)
+  if args.command == 'merge':
+    if len(merged) != 1:
+      raise SystemExit("merge expects coverage files of a single source")
+    next(iter(merged.values())).save(args.output)
+    return
+
+  cpu.color = sys.stdout.isatty() if args.color is None else args.color
+  for source in sorted(merged):
+    report_file(merged[source], summary=args.summary)
+
+if __name__ == "__main__":
+  main()
@@ -1,129 +1,80 @@
 # assembler.py
 
-# Define instruction mapping and register encoding based on design.txt
-instruction_map = {
-  'ADD':  '10000', 'ADC': '10001', 'SUB': '10010', 'AND': '10011000', 'OR': '10011001',
-  'NOT':  '10011010', 'XOR': '10011011', 'SLL': '10011100', 'SRL': '10011101', 'SRA': '10011110',
-  'LB':   '0010', 'LW': '0011', 'SB': '0110', 'SW': '0111', 'MV': '0001', 'MVL': '0100', 'MVH': '0101',
-  'SET':  '110000000000', 'PUSH': '110000000010', 'POP': '110000000011', 'CALL': '11000001', 
-  'RET':  '110000000001', 'NOP': '0000000000000',
-  'BO':   '11100000', 'BO.Z': '11100001', 'BO.NZ': '11100010', 'BO.C': '11100011', 'BO.V': '11100100', 'BO.N': '11100101', 'BO.P': '11100110', 
-  'BA':   '11110000', 'BA.Z': '11110001', 'BA.NZ': '11110010', 'BA.C': '11110011', 'BA.V': '11110100', 'BA.N': '11110101', 'BA.P': '11110110'
-}
-
-register_map = {
-  'R1': '0000', 'R2': '0001', 'R3': '0010', 'R4': '0011', 'R5': '0100', 'R6': '0101', 
-  'R7': '0110', 'R8': '0111', 'R9': '1000', 'R10': '1001', 'R11': '1010', 'R12': '1011',
-  'R13': '1100', 'R14': '1101', 'R15': '1110', 'R16': '1111',
-  'IO': '1011', 'LR': '1100', 'SP': '1101', 'PC': '1110', 'FL': '1111'
-}
+import isa
 
-def parse_rbimm6b(operand):
-  """Parse an rB/#imm6 operand (register or immediate in decimal or hex)."""
-  if operand.startswith('R'):
-    return format(int(register_map[operand]), '06d'), '0'  # Register
-  elif operand.startswith('#'):
-    imm_value = operand[1:]  # Remove the '#' prefix
-    
-    # Check if the value is in hex format
-    if imm_value.startswith('0x'):
-      imm_value = int_2c(imm_value, 6)  # Parse hex value
-    else:
-      imm_value = int(imm_value)  # Parse decimal value
+# Instruction and register encodings live in isa.py; the bit-string maps are kept for reference
+instruction_map = isa.instruction_map
+register_map = isa.register_map
 
-    if imm_value < -(1 << 5) or imm_value >= (1 << 5):
-      raise ValueError(f"Immediate value {imm_value} exceeds the allowed 6-bit range (-32 to 31).")
-    
-    return format(imm_value & 0x3F, '06b'), '1'  # Immediate with 6 bits
-  else:
-    raise ValueError(f"Unknown operand rB/#imm6: {operand}")
-  
-def parse_imm8b(operand):
-  """Parse an #imm8 operand (register or immediate in decimal or hex)."""
+def parse_imm(operand, bits):
+  """Parse a #imm operand of the given width (decimal, or hex as bits-wide 2's complement)."""
   if operand.startswith('#'):
     imm_value = operand[1:]  # Remove the '#' prefix
     
     # Check if the value is in hex format
     if imm_value.startswith('0x'):
       # Convert from hex string using 2's complement
-      imm_value = int_2c(imm_value, 8)
+      imm_value = int_2c(imm_value, bits)
     else:
       # Parse as a regular integer, assuming decimal input
       imm_value = int(imm_value)
     
-    # Ensure the value fits within the 8-bit range (-128 to 127 for signed 2's complement)
-    if imm_value < -(1 << 7) or imm_value >= (1 << 7):
-      raise ValueError(f"Immediate value {imm_value} exceeds the allowed 8-bit range (-128 to 127).")
-    
-    # Convert back to hex 2's complement and return the binary representation
-    return format(imm_value & 0xFF, '08b')  # Format as 8-bit binary string
+    # Ensure the value fits within the signed 2's complement range
+    if imm_value < -(1 << (bits - 1)) or imm_value >= (1 << (bits - 1)):
+      raise ValueError(f"Immediate value {imm_value} exceeds the allowed {bits}-bit range "
+                       f"({-(1 << (bits - 1))} to {(1 << (bits - 1)) - 1}).")
+    return imm_value
   else:
-    raise ValueError(f"Unknown operand #imm8: {operand}")
+    raise ValueError(f"Unknown operand #imm{bits}: {operand}")
 
+def parse_rbimm6b(operand):
+  """Parse an rB/#imm6 operand (register or immediate in decimal or hex); returns (is_imm, value)."""
+  if operand in isa.REGISTER_NUMBERS:
+    return False, parse_reg(operand)  # Register
+  elif operand.startswith('#'):
+    return True, parse_imm(operand, 6)  # Immediate with 6 bits
+  else:
+    raise ValueError(f"Unknown operand rB/#imm6: {operand}")
+  
+def parse_imm8b(operand):
+  """Parse an #imm8 operand (immediate in decimal or hex)."""
+  return parse_imm(operand, 8)
 
 def parse_reg(operand):
   """Parse a reg operand"""
-  return register_map[operand]
+  return isa.REGISTER_NUMBERS[operand]
 
 def assemble_instruction(line):
-  """Converts a line of assembly code into binary machine code."""
+  """Converts a line of assembly code into a 16-bit machine code word."""
   parts = line.split()
   #print(parts)
   if len(parts) == 0:
     return None
   
-  instruction = parts[0]
-  opcode = instruction_map.get(instruction, None)
-  if opcode is None:
-    raise ValueError(f"Unknown instruction: {instruction}")
-  
-  if instruction in ['ADD', 'ADC', 'SUB']:
-    rA = parse_reg(parts[1].rstrip(','))
-    rbimm6, is_imm = parse_rbimm6b(parts[2])
-    return f"{opcode}{is_imm}{rA}{rbimm6}"
-  
-  elif instruction in ['AND', 'OR', 'XOR', 'SLL', 'SRL', 'SRA']:
-    rA = parse_reg(parts[1].rstrip(','))
-    rB = parse_reg(parts[2])
-    return f"{opcode}{rA}{rB}"
-  
-  elif instruction in ['SB', 'SW', 'LB', 'LW', 'MVL', 'MVH']:
-    rA = parse_reg(parts[1].rstrip(','))
-    imm8 = parse_imm8b(parts[2])
-    return f"{opcode}{rA}{imm8}"
-  
-  elif instruction in ['MV']:
-    rA = parse_reg(parts[1].rstrip(','))
-    rB = parse_reg(parts[2])
-    return f"{opcode}0000{rA}{rB}"
-  
-  elif instruction in ['SET', 'PUSH', 'POP']:
-    rA = parse_reg(parts[1])
-    return f"{opcode}{rA}"
-  
-  elif instruction in ['NOT']:
-    rA = parse_reg(parts[1])
-    return f"{opcode}{rA}0000"
-  
-  elif instruction in ['RET', 'NOP']:
-    return f"{opcode}0000"
-  
-  elif instruction in ['CALL',
-                       'BO', 'BO.Z', 'BO.NZ', 'BO.C', 'BO.V', 'BO.N', 'BO.P',
-                       'BA', 'BA.Z', 'BA.NZ', 'BA.C', 'BA.V', 'BA.N', 'BA.P']:
-    imm8 = parse_imm8b(parts[1])
-    return f"{opcode}{imm8}"
-  
-  else:
-    raise ValueError(f"opcode not supported: {opcode}")
+  instruction = isa.BY_NAME.get(parts[0], None)
+  if instruction is None:
+    raise ValueError(f"Unknown instruction: {parts[0]}")
+
+  # Operands follow the mnemonic; anything after them (e.g. a comment) is ignored
+  operands = []
+  for (kind, _, width), part in zip(instruction.fields, parts[1:]):
+    operand = part.rstrip(',')
+    if kind == 'reg':
+      operands.append(parse_reg(operand))
+    elif kind == 'imm':
+      operands.append(parse_imm(operand, width))
+    else:
+      operands.append(parse_rbimm6b(operand))
+  return instruction.encode(*operands)
   
 def assembler_macro(line):
-  """Handles assembler macros"""
+  """Handles assembler macros. Label references are left as (word, label, 'l'/'h') for replace_labels."""
   parts = line.split()
   if line.startswith('asm.call'):
-    MVL = f"01001011{parts[1]}_l"
-    MVH = f"01011011{parts[1]}_h"
-    CALL = f"1100000100000000"
+    label = parts[1][1:]  # Remove the '@' prefix
+    MVL = (isa.encode('MVL', 0xB, 0), label, 'l')
+    MVH = (isa.encode('MVH', 0xB, 0), label, 'h')
+    CALL = isa.encode('CALL', 0)
     binary_code = [MVL, MVH, CALL]
   elif line.startswith('asm.mv'):
     imm_value = parts[2][1:]
@@ -134,58 +85,47 @@ def assembler_macro(line):
     if imm_value < -(1 << 15) or imm_value >= (1 << 15):
       raise ValueError(f"Immediate value {hex_2c(imm_value)} exceeds the allowed 16-bit range (0xFFFF).")
     rA = parse_reg(parts[1].rstrip(','))
-    MVL = f"0100{rA}{format(imm_value & 0xFF, '08b')}"  # Lower 8 bits
-    MVH = f"0101{rA}{format((imm_value >> 8) & 0xFF, '08b')}"  # Higher 8 bits
+    MVL = isa.encode('MVL', rA, 0) | (imm_value & 0xFF)  # Lower 8 bits
+    MVH = isa.encode('MVH', rA, 0) | ((imm_value >> 8) & 0xFF)  # Higher 8 bits
     binary_code = [MVL, MVH]
+  else:
+    raise ValueError(f"Unknown assembler macro: {parts[0]}")
   return binary_code
 
 def replace_labels(binary_output, labels):
-  """Replaces labels @sth_l and _h"""
-  updated_lines = []  # This will store the modified lines
-
-  for line in binary_output:
-    if '@' in line:
-      # Split the line at the '@' symbol
-      parts = line.split('@')
-      binary_part = parts[0]  # The part before '@'
-      name_with_suffix = parts[1]  # The part after '@' (e.g., "multiply_l")
-
-      # Extract the label name (everything before the '_')
-      label_name, suffix = name_with_suffix.split('_')
-
-      # Look up the 16-bit binary value from the labels dictionary
-      if label_name in labels:
-        address_16bit = labels[label_name]  # 16-bit binary value from the dictionary
-
-        # Extract the lower 8 bits and higher 8 bits
-        lower_8_bits = address_16bit[8:]  # Last 8 bits
-        higher_8_bits = address_16bit[:8]  # First 8 bits
-
-        # Replace @name_l or @name_h with the corresponding bits
-        if suffix == 'l':
-          updated_line = binary_part + lower_8_bits
-        elif suffix == 'h':
-          updated_line = binary_part + higher_8_bits
-
-        updated_lines.append(updated_line)
+  """Replaces (word, label, 'l'/'h') entries with the low or high byte of the label address"""
+  updated_lines = []  # This will store the modified words
+
+  for entry in binary_output:
+    if isinstance(entry, tuple):
+      word, label_name, suffix = entry
+
+      # Look up the 16-bit address of the label
+      if label_name not in labels:
+        raise ValueError(f"Cannot find label {label_name}")
+      address = labels[label_name]
+
+      # Fill in the lower 8 bits or the higher 8 bits
+      if suffix == 'l':
+        updated_lines.append(word | (address & 0xFF))
       else:
-          # If the label is not found in the dictionary, leave the line unchanged
-          updated_lines.append(line)
-          raise ValueError(f"Cannot find label {label_name}")
+        updated_lines.append(word | ((address >> 8) & 0xFF))
     else:
-        # If there's no '@', just add the line as is
-        updated_lines.append(line)
+        # Already a complete instruction word
+        updated_lines.append(entry)
   return updated_lines
 
-def assemble_file(input_file, output_file):
-  """Read assembly code from input_file, convert to binary, and write to output_file."""
-  with open(input_file, 'r') as asm_file:
-    lines = asm_file.readlines()
+def assemble_source(lines):
+  """Convert lines of assembly code to 16-bit instruction words.
 
+  Returns (binary_output, labels, line_map): the words, label -> address, and
+  line_map[i], the 1-based source line that produced the word at address 2*i.
+  """
   binary_output = []
   labels = {}
+  line_map = []
   
-  for line in lines:
+  for line_number, line in enumerate(lines, 1):
     line = line.strip()
 
     if line.startswith('asm.stop'):
@@ -193,7 +133,7 @@ def assemble_file(input_file, output_file):
 
     elif line.startswith('@'):     # Adds labels to the dictionary
       label = line[1:]
-      address = format(len(binary_output)*2, '016b')  # Format address as 16-bit binary
+      address = len(binary_output)*2
       if label in labels:
         raise ValueError(f"Label '{label}' already exists in the dictionary.")
       labels[label] = address
@@ -201,19 +141,34 @@ def assemble_file(input_file, output_file):
     # Translate the lines, ignore empty lines, comments and asm instructions
     elif line and not line.startswith('#') and not line.startswith('asm'):
       binary_code = assemble_instruction(line)
-      if binary_code:
+      if binary_code is not None:
         binary_output.append(binary_code)
+        line_map.append(line_number)
 
     elif line.startswith('asm'):
       binary_code = assembler_macro(line)
       if binary_code:
         binary_output.extend(binary_code)
+        line_map.extend([line_number] * len(binary_code))
 
   # Replace labels with their proper addresses
   binary_output = replace_labels(binary_output, labels)
+  return binary_output, labels, line_map
+
+def assemble_words(lines):
+  """Assemble lines of assembly code into a list of 16-bit instruction words."""
+  binary_output, _, _ = assemble_source(lines)
+  return binary_output
+
+def assemble_file(input_file, output_file):
+  """Read assembly code from input_file, convert to binary, and write to output_file."""
+  with open(input_file, 'r') as asm_file:
+    lines = asm_file.readlines()
+
+  binary_output, _, _ = assemble_source(lines)
 
   with open(output_file, 'w') as bin_file:
-    bin_file.write('\n'.join(binary_output))
+    bin_file.write('\n'.join(format(word, '016b') for word in binary_output))
     #print(f"Binary code written to {output_file}")
 
 def hex_2c(n, bits=8):
@@ -0,0 +1,261 @@
+# benchmark.py
+#
+# Small benchmark suite for the emulator tooling:
+#   python benchmark.py            # run all benchmarks
+#   python benchmark.py startup    # run selected benchmarks
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PROGRAM = os.path.join(HERE, 'assembly.txt')
+
+def report(name, seconds, count, unit='run'):
+  print(f"{name:<32} {seconds / count * 1e3:9.3f} ms/{unit}  ({count} {unit}s)")
+
+def timed(modes, repeat, rounds=5):
+  """Best of `rounds` timings of repeat calls per mode; every mode is warmed up first and the rounds interleave the modes."""
+  for function in modes.values():
+    function()
+  timings = dict.fromkeys(modes, float('inf'))
+  for _ in range(rounds):
+    for name, function in modes.items():
+      start = time.perf_counter()
+      for _ in range(repeat):
+        function()
+      timings[name] = min(timings[name], time.perf_counter() - start)
+  return timings
+
+def bench_startup(repeat=20):
+  """Wall time of `cli.py run` as a fresh process, with a warm and a cold cache."""
+  with tempfile.TemporaryDirectory() as cache_dir:
+    command = [sys.executable, os.path.join(HERE, 'cli.py'), '--no-color', '--cache-dir', cache_dir, 'run', PROGRAM]
+    start = time.perf_counter()
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    report('startup (cold cache)', time.perf_counter() - start, 1)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+      subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    report('startup (cached run)', time.perf_counter() - start, repeat)
+
+  command = [sys.executable, '-c', 'pass']
+  start = time.perf_counter()
+  for _ in range(repeat):
+    subprocess.run(command, check=True)
+  report('interpreter baseline', time.perf_counter() - start, repeat)
+
+def countdown_image(count):
+  """Program that counts R4 down from `count` with SUB/SET/BO.P, then halts."""
+  import build
+  words = [0x4300 | (count & 0xFF), 0x5300 | (count >> 8),  # asm.mv R4, #count
+           0x94C1, 0xC003, 0xE6FA,                           # SUB R4, #1 / SET R4 / BO.P #-6
+           0x4BF6, 0x5BFF, 0xF000]                           # jump past 0xFFF4
+  return build.words_to_image(words)
+
+def bench_loops(count=0x7FFF):
+  """Plain run vs. loop fast-forwarding on a countdown loop."""
+  import cpu
+
+  image = countdown_image(count)
+  for accelerate in (False, True):
+    machine = cpu.CPU()
+    machine.load_image(image)
+    start = time.perf_counter()
+    machine.run(ttl=0x3FFFF, accelerate=accelerate)
+    report(f"countdown loop (accelerate={accelerate})", time.perf_counter() - start, 1)
+
+def bench_coverage(repeat=20):
+  """Overhead of coverage recording versus plain run() on assembly.txt."""
+  import asmcov, build, cpu
+
+  image = build.load_image(PROGRAM)
+
+  def run(coverage):
+    machine = cpu.CPU()
+    machine.load_image(image)
+    machine.run(coverage=asmcov.Coverage() if coverage else None)
+
+  timings = timed({'plain': lambda: run(False), 'coverage': lambda: run(True)}, repeat)
+  for mode, elapsed in timings.items():
+    report(f"assembly.txt ({mode})", elapsed, repeat)
+  print(f"coverage overhead: {timings['coverage'] / timings['plain']:.2f}x")
+
+def bench_memory(instances=1000):
+  """Resident memory per CPU instance: flat memory list vs. shared ROM pages."""
+  import gc, tracemalloc
+  import build, cpu, pagedmem
+
+  image = build.load_image(PROGRAM)
+  rom = pagedmem.SharedROM(image)
+  for mode in ('flat', 'shared rom'):
+    gc.collect()
+    tracemalloc.start()
+    machines = []
+    for _ in range(instances):
+      if mode == 'flat':
+        machine = cpu.CPU()
+        machine.load_image(image)
+      else:
+        machine = cpu.CPU(rom=rom)
+      machines.append(machine)
+    created = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    for machine in machines:
+      machine.run()
+    elapsed = time.perf_counter() - start
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{mode:<12} {created / instances / 1024:8.1f} KB/instance after load, "
+          f"{used / instances / 1024:8.1f} KB/instance after run")
+    report(f"run assembly.txt ({mode})", elapsed, instances)
+    del machines
+
+def bench_scheduler(repeat=20):
+  """Overhead of the event scheduler on plain run(), and timer interrupts waking an idle loop."""
+  import build, cpu, interrupts
+
+  image = build.load_image(PROGRAM)
+  timings = {}
+  for mode in ('plain', 'timer attached'):
+    start = time.perf_counter()
+    for _ in range(repeat):
+      machine = cpu.CPU()
+      machine.load_image(image)
+      if mode != 'plain':
+        interrupts.Timer(machine, line=0).start(period=1 << 20)  # armed, but does not fire during the run
+      machine.run()
+    timings[mode] = time.perf_counter() - start
+    report(f"assembly.txt ({mode})", timings[mode], repeat)
+  print(f"scheduler overhead: {timings['timer attached'] / timings['plain']:.2f}x")
+
+  # MVL FL, #32 (enable interrupts) / BO #-2 (idle) / ISR: ADD R1, #1 / RETI
+  words = [0x4F20, 0xE0FE, 0x8441, 0xC040]
+  for accelerate in (False, True):
+    machine = cpu.CPU()
+    machine.load_block(0, words)
+    interrupts.InterruptController(machine).set_vector(0, 4)
+    interrupts.Timer(machine, line=0).start(period=1000)
+    start = time.perf_counter()
+    machine.run(ttl=1000000, accelerate=accelerate)
+    report(f"idle + timer irq (accelerate={accelerate})", time.perf_counter() - start, 1)
+
+def bench_profiler(repeat=20):
+  """Profiler overhead versus plain run() at several sampling intervals."""
+  import build, cpu, profiler
+
+  image = build.load_image(PROGRAM)
+  labels = build.load_debug_info(PROGRAM)['labels']
+
+  def run(interval):
+    machine = cpu.CPU()
+    machine.load_image(image)
+    if interval is None:
+      machine.run()
+    else:
+      profiler.Profiler(labels, interval=interval).run(machine)
+
+  intervals = (None, 1, 10, 100, 10000)
+  timings = timed({interval: (lambda interval=interval: run(interval)) for interval in intervals}, repeat)
+  plain = timings[None]
+  report("assembly.txt (plain)", plain, repeat)
+  for interval in intervals[1:]:
+    report(f"assembly.txt (profile every {interval})", timings[interval], repeat)
+    print(f"  overhead: {timings[interval] / plain:.2f}x")
+
+def bench_multicore(iterations=2000):
+  """Aggregate throughput of multicore.System as cores are added, each bumping a shared counter under a TAS lock."""
+  import assembler, build, multicore
+
+  words = assembler.assemble_words(f"""
+    asm.mv IO, #0x4000
+    asm.mv R4, #{iterations}
+    TAS R2, #0
+    SET R2
+    BO.NZ #-6
+    LW R5, #2
+    ADD R5, #1
+    SW R5, #2
+    asm.mv R3, #0
+    SW R3, #0
+    SUB R4, #1
+    SET R4
+    BO.P #-24
+    asm.mv IO, #0xFFF6
+    BA #0""".strip().splitlines())
+  for cores, quantum in ((1, 100), (2, 100), (4, 100), (8, 100), (4, 1), (4, 1000)):
+    system = multicore.System(cores, quantum)
+    system.load_image(build.words_to_image(words))
+    start = time.perf_counter()
+    executed = system.run(ttl=1 << 24)
+    elapsed = time.perf_counter() - start
+    assert system.cores[0].read_word(0x4002) == cores * iterations
+    report(f"{cores} cores, quantum {quantum}", elapsed, executed // 1000, 'kinstr')
+
+def bench_fusion(repeat=50):
+  """Superinstruction fusion versus plain run() on assembly.txt and a loop of asm.mv / SET+BO pairs."""
+  import assembler, build, cpu
+
+  # R4 counts down from 0x3FFF; every iteration does an asm.mv and two SET/BO tests
+  loop = build.words_to_image(assembler.assemble_words("""
+    asm.mv R4, #0x3FFF
+    asm.mv R5, #0x1234
+    SET R5
+    BO.Z #0
+    SUB R4, #1
+    SET R4
+    BO.P #-14
+    asm.mv IO, #0xFFF6
+    BA #0""".strip().splitlines()))
+
+  def run(image, fuse):
+    machine = cpu.CPU()
+    machine.load_image(image)
+    machine.run(ttl=0xFFFFF, fuse=fuse)
+
+  for name, image, count in (('assembly.txt', build.load_image(PROGRAM), repeat), ('mv/test loop', loop, 1)):
+    # the warm-up also imports fusion and fills its group cache
+    timings = timed({fuse: (lambda fuse=fuse: run(image, fuse)) for fuse in (False, True)}, count, rounds=10)
+    for fuse, elapsed in timings.items():
+      report(f"{name} (fuse={fuse})", elapsed, count)
+    print(f"  speedup: {timings[False] / timings[True]:.2f}x")
+
+def bench_async(instances=200, slice=100):
+  """Many machines interleaved on one asyncio event loop versus running them one after another."""
+  import asyncio
+  import build, cpu, pagedmem
+
+  rom = pagedmem.SharedROM(build.load_image(PROGRAM))
+  machines = [cpu.CPU(rom=rom) for _ in range(instances)]
+  start = time.perf_counter()
+  for machine in machines:
+    machine.run()
+  report("assembly.txt (run)", time.perf_counter() - start, instances)
+
+  async def run_all(machines):
+    return await asyncio.gather(*(machine.run_async(slice, ttl=0xFFFF) for machine in machines))
+
+  machines = [cpu.CPU(rom=rom) for _ in range(instances)]
+  start = time.perf_counter()
+  stops = asyncio.run(run_all(machines))
+  report(f"assembly.txt (run_async, slice {slice})", time.perf_counter() - start, instances)
+  assert all(stop.reason == cpu.HALT for stop in stops)
+
+BENCHMARKS = {
+  'startup': bench_startup,
+  'loops': bench_loops,
+  'coverage': bench_coverage,
+  'memory': bench_memory,
+  'scheduler': bench_scheduler,
+  'profiler': bench_profiler,
+  'multicore': bench_multicore,
+  'fusion': bench_fusion,
+  'async': bench_async,
+}
+
+if __name__ == "__main__":
+  for name in sys.argv[1:] or BENCHMARKS:
+    BENCHMARKS[name]()
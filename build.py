@@ -0,0 +1,75 @@
+# build.py
+#
+# Content-addressed cache for assembled images. The cache key is the sha256 of
+# the assembly source, so an unchanged program is never re-assembled and the
+# assembler module is not even imported on a cache hit.
+
+import hashlib
+import os
+
+CACHE_DIR = os.environ.get('ASM_CACHE_DIR', '.asm_cache')
+CACHE_VERSION = b'3'  # bump when the assembler output format changes
+
+def source_hash(source):
+  """Return the cache key for the raw bytes of an assembly source."""
+  return hashlib.sha256(CACHE_VERSION + source).hexdigest()
+
+def words_to_image(words):
+  """Pack 16-bit instruction words into a big-endian byte image."""
+  image = bytearray()
+  for word in words:
+    image.append((word >> 8) & 0xFF)
+    image.append(word & 0xFF)
+  return bytes(image)
+
+def image_to_words(image):
+  """Unpack a big-endian byte image into 16-bit instruction words."""
+  return [(image[i] << 8) | image[i + 1] for i in range(0, len(image) - 1, 2)]
+
+def _write_atomic(path, data):
+  # CI runs many builds in parallel, so never leave a half-written cache entry
+  tmp = f"{path}.{os.getpid()}.tmp"
+  with open(tmp, 'wb') as file:
+    file.write(data)
+  os.replace(tmp, path)
+
+def _cache_path(input_file, cache_dir):
+  if cache_dir is None:
+    cache_dir = CACHE_DIR
+  with open(input_file, 'rb') as file:
+    source = file.read()
+  return source, os.path.join(cache_dir, source_hash(source))
+
+def _assemble(source, path):
+  import assembler  # only needed on a cache miss
+  import json
+  binary_output, labels, line_map = assembler.assemble_source(source.decode().splitlines())
+  image = words_to_image(binary_output)
+  debug_info = {'lines': line_map, 'labels': labels}
+  os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+  _write_atomic(path + '.json', json.dumps(debug_info).encode())
+  _write_atomic(path + '.bin', image)
+  return image, debug_info
+
+def load_image(input_file, cache_dir=None):
+  """Return the assembled byte image of input_file, assembling only on a cache miss."""
+  source, path = _cache_path(input_file, cache_dir)
+  try:
+    with open(path + '.bin', 'rb') as file:
+      return file.read()
+  except FileNotFoundError:
+    return _assemble(source, path)[0]
+
+def load_debug_info(input_file, cache_dir=None):
+  """Return the debug info of input_file.
+
+  {'lines': word index -> 1-based source line, 'labels': label -> address}
+  """
+  import json  # kept off the startup path of `cli.py run`
+
+  source, path = _cache_path(input_file, cache_dir)
+  try:
+    with open(path + '.json', 'rb') as file:
+      return json.loads(file.read())
+  except FileNotFoundError:
+    return _assemble(source, path)[1]
@@ -0,0 +1,135 @@
+# cli.py
+#
+# Command line entry point:
+#   python cli.py assemble assembly.txt -o binary.txt
+#   python cli.py run assembly.txt --ttl 0xFFFF
+#   python cli.py profile assembly.txt --interval 100
+#   python cli.py disasm binary.txt
+#   python cli.py debug assembly.txt
+#
+# Keep the imports at the top minimal: `run` is invoked thousands of times by CI,
+# so the assembler, disassembler and debugger are only imported when needed.
+
+import argparse
+import sys
+
+import build
+import cpu
+
+def cmd_assemble(args):
+  image = build.load_image(args.source, args.cache_dir)
+  words = build.image_to_words(image)
+  with open(args.output, 'w') as bin_file:
+    bin_file.write('\n'.join(format(word, '016b') for word in words))
+
+def cmd_run(args):
+  cpu.color = args.color
+  image = build.load_image(args.source, args.cache_dir)
+  if args.verify:
+    import accelerator
+    # the modes this run uses; --verify alone checks --fast-loops as before
+    differences = accelerator.differential_run(image, args.ttl, accelerate=args.fast_loops or not args.fuse, fuse=args.fuse)
+    for difference in differences:
+      print(f"[diff] {difference}")
+    if differences:
+      sys.exit(1)
+  coverage = None
+  if args.coverage:
+    import asmcov
+    coverage = asmcov.Coverage.for_source(args.source)
+  machine = cpu.CPU()
+  machine.load_image(image)
+  stop = machine.run(ttl=args.ttl, accelerate=args.fast_loops, coverage=coverage, fuse=args.fuse)
+  print(cpu.colored("[halt]", 31), stop)
+  if coverage is not None:
+    coverage.save(args.coverage)
+  machine.print_registers_dense()
+  machine.print_flags()
+  for address in args.dump:
+    print(f"mem[0x{address:04X}]: {machine.read_word(address)}")
+
+def cmd_profile(args):
+  import profiler
+
+  image = build.load_image(args.source, args.cache_dir)
+  labels = build.load_debug_info(args.source, args.cache_dir)['labels']
+  machine = cpu.CPU()
+  machine.load_image(image)
+  prof = profiler.Profiler(labels, interval=args.interval)
+  prof.run(machine, ttl=args.ttl)
+  if args.output:
+    prof.write_collapsed(args.output)
+  else:
+    print('\n'.join(prof.collapsed()))
+
+def cmd_disasm(args):
+  import disassembler
+
+  if args.source:
+    words = build.image_to_words(build.load_image(args.file, args.cache_dir))
+  else:
+    with open(args.file, 'r') as bin_file:
+      words = [int(line.strip(), 2) for line in bin_file if line.strip()]
+  for i, word in enumerate(words):
+    print(f"0x{2*i:04X}: {word:016b}  {disassembler.disassemble_instruction(hex(word))}")
+
+def cmd_debug(args):
+  cpu.color = args.color
+  image = build.load_image(args.source, args.cache_dir)
+  machine = cpu.CPU()
+  machine.load_image(image)
+  machine.stepwise_run()
+  machine.print_registers_dense()
+  machine.print_flags()
+
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser(prog='cli.py', description='16bit cpu toolchain')
+  parser.add_argument('--cache-dir', default=None, help='assembled image cache (default: $ASM_CACHE_DIR or .asm_cache)')
+  color = parser.add_mutually_exclusive_group()
+  color.add_argument('--color', dest='color', action='store_true', default=None, help='force ANSI colours')
+  color.add_argument('--no-color', dest='color', action='store_false', help='disable ANSI colours')
+  commands = parser.add_subparsers(dest='command', required=True)
+
+  p = commands.add_parser('assemble', help='assemble a source file into binary.txt format')
+  p.add_argument('source')
+  p.add_argument('-o', '--output', default='binary.txt')
+  p.set_defaults(func=cmd_assemble)
+
+  p = commands.add_parser('run', help='run a program headless and print the final state')
+  p.add_argument('source')
+  p.add_argument('--ttl', type=lambda s: int(s, 0), default=None, help='max number of instructions')
+  p.add_argument('--dump', type=lambda s: int(s, 0), action='append', default=[], help='print the memory word at ADDRESS')
+  p.add_argument('--fast-loops', action='store_true', help='fast-forward counted and idle loops')
+  p.add_argument('--fuse', action='store_true', help='execute common instruction pairs as superinstructions')
+  p.add_argument('--verify', action='store_true', help='first check that --fast-loops/--fuse give the same result as plain execution')
+  p.add_argument('--coverage', metavar='FILE', help='record line and branch coverage to FILE (see asmcov.py)')
+  p.set_defaults(func=cmd_run)
+
+  p = commands.add_parser('profile', help='sample the guest call stack, print collapsed stacks for flamegraphs')
+  p.add_argument('source')
+  p.add_argument('--ttl', type=lambda s: int(s, 0), default=None, help='max number of instructions')
+  p.add_argument('--interval', type=int, default=100, help='instructions between samples')
+  p.add_argument('-o', '--output', help='write the collapsed stacks to OUTPUT instead of stdout')
+  p.set_defaults(func=cmd_profile)
+
+  p = commands.add_parser('disasm', help='disassemble a binary.txt file')
+  p.add_argument('file')
+  p.add_argument('-s', '--source', action='store_true', help='FILE is assembly source, disassemble its image')
+  p.set_defaults(func=cmd_disasm)
+
+  p = commands.add_parser('debug', help='step through a program interactively')
+  p.add_argument('source')
+  p.set_defaults(func=cmd_debug)
+
+  args = parser.parse_args(argv)
+  if args.color is None:
+    # headless runs (CI logs, pipes) get plain output
+    args.color = sys.stdout.isatty()
+  return args
+
+def main(argv=None):
+  args = parse_args(argv)
+  args.func(args)
+
+if __name__ == "__main__":
+  main()
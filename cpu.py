@@ -1,9 +1,63 @@
-import disassembler
+import os
+import sys
+
+import isa
+
+# ANSI colours for terminal output; disabled for headless batch runs
+color = True
+
+def colored(text, code):
+  if not color:
+    return text
+  return f"\033[{code}m{text}\033[0m"
+
+# Why run() / run_iter() stopped (Stop.reason)
+HALT = 'halt'              # PC passed 0xFFF4
+BUDGET = 'budget'          # ttl or cycle limit used up
+BREAKPOINT = 'breakpoint'  # in front of a breakpoint address
+DEADLINE = 'deadline'      # wall-clock deadline passed
+EXCEPTION = 'exception'    # an instruction raised (Stop.error, Stop.pc is its address)
+SLICE = 'slice'            # run_iter() finished a slice, more to come
+
+class Stop:
+  """Result of run() and run_iter(): reason, PC and CPU.cycles at the stop, and the error for EXCEPTION."""
+
+  __slots__ = ('reason', 'pc', 'cycles', 'error')
+
+  def __init__(self, reason, pc, cycles, error=None):
+    self.reason = reason
+    self.pc = pc
+    self.cycles = cycles
+    self.error = error
+
+  def __repr__(self):
+    return f"Stop({self.reason!r}, pc=0x{self.pc:04X}, cycles={self.cycles}" + (f", error={self.error!r})" if self.error else ")")
+
+  def __str__(self):
+    if self.reason == HALT:
+      return "reached 0xFFF4 with PC"
+    if self.reason == BUDGET:
+      return "ttl decreased to 0"
+    if self.reason == BREAKPOINT:
+      return f"breakpoint at 0x{self.pc:04X}"
+    if self.reason == DEADLINE:
+      return "wall-clock deadline passed"
+    if self.reason == EXCEPTION:
+      return f"{type(self.error).__name__}: {self.error}"
+    return f"slice done at 0x{self.pc:04X}"
 
 class CPU:
-  def __init__(self):
+  def __init__(self, rom=None, memory=None):
     # Memory
-    self.memory = [0] * (0xFFFF + 1)  # 24-bit address space
+    self.rom = rom
+    self.shared_memory = memory  # bytearray shared with other cores (multicore.System)
+    if memory is not None:
+      self.memory = memory
+    elif rom is not None:
+      import pagedmem  # share ROM pages with other instances, copy RAM pages on write
+      self.memory = pagedmem.PagedMemory(rom)
+    else:
+      self.memory = bytearray(0xFFFF + 1)  # 16-bit address space
     
     # Registers
     self.registers = [0] * 16  # R1 to R16
@@ -11,6 +65,12 @@ class CPU:
     # init sp
     self.sp = 0x9FFE  # Stack Pointer (24-bit), initialized to top of stack
     
+    # Instructions executed by run(); timed devices schedule events on it
+    self.cycles = 0
+    self.scheduler = None  # scheduler.EventScheduler, created by interrupts.InterruptController
+    self.interrupts = None  # interrupts.InterruptController
+    self.fault_pc = None  # address of the instruction that raised out of the last run, for Stop.pc
+
     # init flags
     self.z = 0  # Zero
     self.n = 0  # Negative
@@ -114,9 +174,13 @@ class CPU:
       self.fl &= ~(0<<4)
 
   def reset(self):
-    self.__init__()
+    self.__init__(self.rom, self.shared_memory)
 
   def load_program_from_file(self, filename, start_address=0):
+    """Load a binary.txt file, or an in-memory image (bytes or an array of words, see load_block)."""
+    if not isinstance(filename, (str, os.PathLike)):
+      self.load_block(start_address, filename)
+      return
     with open(filename, 'r') as file:
       for i, line in enumerate(file):
         # Remove any whitespace (like newlines)
@@ -133,6 +197,56 @@ class CPU:
         self.memory[start_address + 2*i] = upper_byte
         self.memory[start_address + 2*i + 1] = lower_byte
 
+  def load_image(self, image, start_address=0):
+    """Load a big-endian byte image (as produced by build.load_image) into memory."""
+    self.load_block(start_address, image)
+
+  def load_block(self, address, data):
+    """Copy data into memory at address in one go.
+
+    data is either raw big-endian bytes (bytes, bytearray, memoryview) or
+    16-bit words: a list, an array.array('H') or a numpy integer array.
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+      image = bytes(data)
+    elif hasattr(data, 'astype'):  # numpy array, any byte order
+      image = data.astype('>u2').tobytes()
+    else:
+      import array
+      words = array.array('H', data)
+      if sys.byteorder == 'little':
+        words.byteswap()
+      image = words.tobytes()
+    if address < 0 or address + len(image) > len(self.memory):
+      raise ValueError("Block 0x{:X}+{} exceeds the address space".format(address, len(image)))
+    self.memory[address:address + len(image)] = image
+
+  def dump_block(self, address, count):
+    """Read count big-endian 16-bit words starting at address; returns an array.array('H')."""
+    if address < 0 or address + 2*count > len(self.memory):
+      raise ValueError("Block 0x{:X}+{} exceeds the address space".format(address, 2*count))
+    import array
+    words = array.array('H', bytes(self.memory[address:address + 2*count]))
+    if sys.byteorder == 'little':
+      words.byteswap()
+    return words
+
+  def memory_view(self, address=0, count=None):
+    """NumPy view of count big-endian words at address (requires numpy).
+
+    The view shares the CPU's memory, so it reflects later writes without
+    copying. Paged memory (CPU(rom=...)) has no contiguous buffer; there the
+    result is a read-only snapshot.
+    """
+    import numpy  # optional dependency, only needed for this method
+
+    if count is None:
+      count = (len(self.memory) - address) // 2
+    if address < 0 or address + 2*count > len(self.memory):
+      raise ValueError("Block 0x{:X}+{} exceeds the address space".format(address, 2*count))
+    buffer = self.memory if isinstance(self.memory, bytearray) else bytes(self.memory)
+    return numpy.frombuffer(buffer, dtype='>u2', count=count, offset=address)
+
   def fetch(self):
     instruction = (self.memory[self.pc] << 8) | self.memory[self.pc + 1]
     return instruction
@@ -140,171 +254,331 @@ class CPU:
   def decode_and_execute(self, instruction):
     self.pc += 2
 
-    opcode = (instruction >> 12) & 0xF
-    
-    if opcode == 0b0010:  # LB
-      ra = (instruction >> 8) & 0xF
-      imm8 = instruction & 0xFF
-      if imm8 & 0x80:  # If the highest bit (sign bit) is set
-        imm8 -= 0x100  # Convert to negative two's complement
-      address = self.io + imm8
-      self.registers[ra] = self.read_byte(address)
-    
-    elif opcode == 0b0011:  # LW
-      ra = (instruction >> 8) & 0xF
-      imm8 = instruction & 0xFF
-      if imm8 & 0x80:  # If the highest bit (sign bit) is set
-        imm8 -= 0x100  # Convert to negative two's complement
-      address = self.io + imm8
-      if address % 2 != 0:
-        raise ValueError("Access to an odd address is not allowed: 0x{:X}".format(address))
-      self.registers[ra] = self.read_word(address)
-  
-    elif opcode == 0b0110:  # SB
-      ra = (instruction >> 8) & 0xF
-      imm8 = instruction & 0xFF
-      if imm8 & 0x80:  # If the highest bit (sign bit) is set
-        imm8 -= 0x100  # Convert to negative two's complement
-      address = self.io + imm8
-      self.write_byte(address, self.registers[ra])
-    
-    elif opcode == 0b0111:  # SW
-      ra = (instruction >> 8) & 0xF
-      imm8 = instruction & 0xFF
-      if imm8 & 0x80:  # If the highest bit (sign bit) is set
-        imm8 -= 0x100  # Convert to negative two's complement
-      address = self.io + imm8
-      if address % 2 != 0:
-        raise ValueError("Access to an odd address is not allowed: 0x{:X}".format(address))
-      self.write_word(address, self.registers[ra])
-  
-    elif opcode == 0b0001:  # MV
-      ra = (instruction >> 4) & 0xF
-      rb = instruction & 0xF
-      self.registers[ra] = self.registers[rb]
-    
-    elif opcode == 0b0100: # MVL
-      ra = (instruction >> 8) & 0xF
-      imm8 = instruction & 0xFF
-      self.registers[ra] = (self.registers[ra] & 0xFF00) | (imm8)
-      
-    elif opcode == 0b0101: # MVH
-      ra = (instruction >> 8) & 0xF
-      imm8 = instruction & 0xFF
-      self.registers[ra] = (self.registers[ra] & 0x00FF) | (imm8 << 8)
+    # Decoding is driven by the isa table and memoized per instruction word
+    try:
+      execute, operands = _decoded[instruction]
+    except KeyError:
+      execute, operands = _decode(instruction)
+    execute(self, *operands)
+
+  # Instruction semantics, one op_<mnemonic> per isa.INSTRUCTIONS row
+
+  def op_add(self, ra, rb_imm):
+    is_imm, b = rb_imm
+    b = b & 0x3F if is_imm else self.registers[b]  # imm6 is zero-extended, as in verilog/alu.sv
+    self.registers[ra] = self.alu_add(self.registers[ra], b)
+
+  def op_adc(self, ra, rb_imm):
+    is_imm, b = rb_imm
+    b = b & 0x3F if is_imm else self.registers[b]
+    self.registers[ra] = self.alu_add(self.registers[ra], b, with_carry=True)
+
+  def op_sub(self, ra, rb_imm):
+    is_imm, b = rb_imm
+    b = b & 0x3F if is_imm else self.registers[b]
+    self.registers[ra] = self.alu_sub(self.registers[ra], b)
+
+  def op_and(self, ra, rb):
+    self.registers[ra] = self.alu_and(self.registers[ra], self.registers[rb])
+
+  def op_or(self, ra, rb):
+    self.registers[ra] = self.alu_or(self.registers[ra], self.registers[rb])
+
+  def op_not(self, ra):
+    self.registers[ra] = self.alu_not(self.registers[ra])
+
+  def op_xor(self, ra, rb):
+    self.registers[ra] = self.alu_xor(self.registers[ra], self.registers[rb])
+
+  def op_sll(self, ra, rb):
+    self.registers[ra] = self.alu_shift(self.registers[ra], self.registers[rb], 'left')
+
+  def op_srl(self, ra, rb):
+    self.registers[ra] = self.alu_shift(self.registers[ra], self.registers[rb], 'right')
+
+  def op_sra(self, ra, rb):
+    self.registers[ra] = self.alu_shift(self.registers[ra], self.registers[rb], 'right', arithmetic=True)
+
+  def op_lb(self, ra, imm8):
+    address = self.io + imm8
+    self.registers[ra] = self.read_byte(address)
+
+  def op_lw(self, ra, imm8):
+    address = self.io + imm8
+    if address % 2 != 0:
+      raise ValueError("Access to an odd address is not allowed: 0x{:X}".format(address))
+    self.registers[ra] = self.read_word(address)
+
+  def op_sb(self, ra, imm8):
+    address = self.io + imm8
+    self.write_byte(address, self.registers[ra])
+
+  def op_sw(self, ra, imm8):
+    address = self.io + imm8
+    if address % 2 != 0:
+      raise ValueError("Access to an odd address is not allowed: 0x{:X}".format(address))
+    self.write_word(address, self.registers[ra])
+
+  def op_tas(self, ra, imm8):
+    # a single instruction, so no other core runs between the read and the write
+    address = self.io + imm8
+    if address % 2 != 0:
+      raise ValueError("Access to an odd address is not allowed: 0x{:X}".format(address))
+    self.registers[ra] = self.read_word(address)
+    self.write_word(address, 1)
+
+  def op_mv(self, ra, rb):
+    self.registers[ra] = self.registers[rb]
+
+  def op_mvl(self, ra, imm8):
+    self.registers[ra] = (self.registers[ra] & 0xFF00) | (imm8 & 0xFF)
+
+  def op_mvh(self, ra, imm8):
+    self.registers[ra] = (self.registers[ra] & 0x00FF) | ((imm8 & 0xFF) << 8)
+
+  def op_set(self, ra):
+    self.set_flags(self.registers[ra])
+
+  def op_push(self, ra):
+    self.sp -= 2
+    self.write_word(self.sp, self.registers[ra])
+
+  def op_pop(self, ra):
+    self.registers[ra] = self.read_word(self.sp)
+    self.sp += 2
+
+  def op_call(self, imm8):
+    self.lr = self.pc
+    self.pc = self.io + imm8
+
+  def op_ret(self):
+    self.pc = self.lr
+
+  def op_reti(self):
+    self.pc = self.lr
+    self.fl = self.read_word(self.sp)
+    self.lr = self.read_word(self.sp + 2)
+    self.sp += 4
+
+  def op_nop(self):
+    pass
+
+  def op_jump(self, imm8, condition, is_branch_offset):
+    """BO* (is_branch_offset) and BA*; condition is the isa condition code."""
+    if imm8 & 0x1:
+      raise ValueError("Jumped to uneven address; not supported!")
     
-    elif opcode == 0x8:  # Arithmetic operations ADD and ADC
-      ra = (instruction >> 6) & 0xF
-      rb = instruction & 0xF
-      imm = instruction & 0x3F
-      is_imm = (instruction >> 10) & 0x1
-      
-      if ((instruction >> 11) & 0x1) == 0x0:  # ADD
-        b = imm if is_imm else self.registers[rb]
-        self.registers[ra] = self.alu_add(self.registers[ra], b)
-      elif ((instruction >> 11) & 0x1) == 0x1:  # ADC
-        b = imm if is_imm else self.registers[rb]
-        self.registers[ra] = self.alu_add(self.registers[ra], b, with_carry=True)
-
-    elif opcode == 0x9: # Rest of Arithmetic operations
-      subop = (instruction >> 8) & 0xF
-      ra = (instruction >> 4) & 0xF
-      rb = instruction & 0xF
-
-      if (instruction >> 10) & 0x1:  # SUB
-        ra = (instruction >> 6) & 0xF
-        imm = instruction & 0x3F
-        is_imm = (instruction >> 10) & 0x1
-        b = imm if is_imm else self.registers[rb]
-        self.registers[ra] = self.alu_sub(self.registers[ra], b)
-      elif subop == 0x8:  # AND
-        self.registers[ra] = self.alu_and(self.registers[ra], self.registers[rb])
-      elif subop == 0x9:  # OR
-        self.registers[ra] = self.alu_or(self.registers[ra], self.registers[rb])
-      elif subop == 0xA:  # NOT
-        self.registers[ra] = self.alu_not(self.registers[ra])
-      elif subop == 0xB:  # XOR
-        self.registers[ra] = self.alu_xor(self.registers[ra], self.registers[rb])
-      elif subop == 0xC:  # SLL
-        self.registers[ra] = self.alu_shift(self.registers[ra], self.registers[rb], 'left')
-      elif subop == 0xD:  # SRL
-        self.registers[ra] = self.alu_shift(self.registers[ra], self.registers[rb], 'right')
-      elif subop == 0xE:  # SRA
-        self.registers[ra] = self.alu_shift(self.registers[ra], self.registers[rb], 'right', arithmetic=True)
-      
-    elif opcode == 0xC:  # Control instructions
-      subop = (instruction >> 4) & 0xF
-      if (instruction >> 8) & 0xF == 0x1: # CALL
-        imm8 = instruction & 0xFF
-        if imm8 & 0x80:  # If the highest bit (sign bit) is set
-          imm8 -= 0x100  # Convert to negative two's complement
-        self.lr = self.pc
+    should_jump = False
+    if condition == 0:  # Unconditional
+      should_jump = True
+    elif condition == 1 and self.z:  # Z
+      should_jump = True
+    elif condition == 2 and not self.z:  # NZ
+      should_jump = True
+    elif condition == 3 and self.c:  # C
+      should_jump = True
+    elif condition == 4 and self.v:  # V
+      should_jump = True
+    elif condition == 5 and self.n:  # N
+      should_jump = True
+    elif condition == 6 and self.p:  # P
+      should_jump = True
+        
+    if should_jump:
+      if is_branch_offset:
+        self.pc += imm8
+        if self.pc > 0xFFFF or self.pc < 0x0000:
+          raise ValueError("PC out of range, jumped too far.")
+      else:
         self.pc = self.io + imm8
-      elif subop == 0x0:  # SET
-        ra = instruction & 0xF
-        self.set_flags(self.registers[ra])
-      elif subop == 0x2:  # PUSH
-        ra = instruction & 0xF
-        self.sp -= 2
-        self.write_word(self.sp, self.registers[ra])
-      elif subop == 0x3:  # POP
-        ra = instruction & 0xF
-        self.registers[ra] = self.read_word(self.sp)
-        self.sp += 2
-      elif subop == 0x1:  # RET
-        self.pc = self.lr
-
-    elif opcode in [0xE, 0xF]:  # Jump instructions
-      imm8 = instruction & 0xFF
-      if imm8 & 0x80:  # If the highest bit (sign bit) is set
-        imm8 -= 0x100  # Convert to negative two's complement
-      condition = (instruction >> 8) & 0x7
-      is_branch_offset = opcode == 0xE
-
-      if instruction & 0x1:
-        raise ValueError("Jumped to uneven address; not supported!")
-      
-      should_jump = False
-      if condition == 0:  # Unconditional
-        should_jump = True
-      elif condition == 1 and self.z:  # Z
-        should_jump = True
-      elif condition == 2 and not self.z:  # NZ
-        should_jump = True
-      elif condition == 3 and self.c:  # C
-        should_jump = True
-      elif condition == 4 and self.v:  # V
-        should_jump = True
-      elif condition == 5 and self.n:  # N
-        should_jump = True
-      elif condition == 6 and self.p:  # P
-        should_jump = True
-          
-      if should_jump:
-        if is_branch_offset:
-          self.pc += imm8
-          if self.pc > 0xFFFF or self.pc < 0x0000:
-            raise ValueError("PC out of range, jumped too far.")
-          #self.pc += sign_extend(imm8, 8)
-        else:
-          self.pc = self.io + imm8
-          #self.pc = self.read_word((self.registers[12] << 8) + imm8)
   
-  def run(self, ttl = None):
+  def run(self, ttl = None, accelerate = False, coverage = None, fuse = False, breakpoints = None):
+    """Execute until PC passes 0xFFF4, ttl instructions have run or a breakpoint is reached.
+
+    accelerate fast-forwards recognised loops (accelerator.py), fuse executes
+    common instruction pairs as superinstructions (fusion.py). breakpoints is
+    a set of addresses to stop in front of; the instruction run() starts on is
+    always executed, so calling run() again continues past a breakpoint.
+    Loops are not fast-forwarded while breakpoints are set.
+
+    Returns a Stop (HALT, BUDGET or BREAKPOINT); nothing is printed.
+    Exceptions raised by an instruction propagate.
+    """
     if ttl == None:
       ttl = 0xFFFF # Change for longer programs 
-    while ttl > 0:
-      instruction = self.fetch()
-      self.decode_and_execute(instruction)
-
-      ttl -= 1
-      # halt condition
-      if self.pc > 0xFFF4:
-        print("\033[31m[halt]\033[0m reached 0xFFF4 with PC")
-        break
-
-    if ttl == 0:
-      print("\033[31m[halt]\033[0m ttl decreased to 0")
+    if coverage is not None:
+      # coverage needs every instruction, so loops are never fast-forwarded
+      reason, _ = self._run_coverage(ttl, coverage, breakpoints)
+    else:
+      reason, _ = self._run(ttl, accelerate, fuse, breakpoints)
+    return Stop(reason, self.pc, self.cycles)
+
+  def run_iter(self, slice = 1000, ttl = None, cycle_limit = None, deadline = None, accelerate = False, fuse = False, breakpoints = None):
+    """Generator that executes slice instructions at a time and yields a Stop after each slice.
+
+    It is resumable: every SLICE stop returns control to the caller, and the
+    next iteration continues where the machine left off, so many machines
+    can be interleaved. The last Stop yielded is HALT, BUDGET (ttl more
+    instructions executed, or CPU.cycles reached cycle_limit), DEADLINE
+    (time.monotonic() passed deadline, checked between slices) or EXCEPTION
+    (the instruction's error is in Stop.error). After a BREAKPOINT stop,
+    iterating again continues past the breakpoint. ttl None means no limit.
+    """
+    if slice < 1:
+      raise ValueError(f"Slice must be at least 1 instruction, got {slice}.")
+    if deadline is not None:
+      import time
+    resume = True  # the instruction at the starting PC runs even if it is a breakpoint
+    while True:
+      count = slice
+      if ttl is not None:
+        count = min(count, ttl)
+      if cycle_limit is not None:
+        count = min(count, cycle_limit - self.cycles)
+      if count <= 0:
+        yield Stop(BUDGET, self.pc, self.cycles)
+        return
+      try:
+        reason, remaining = self._run(count, accelerate, fuse, breakpoints, resume)
+      except Exception as error:
+        yield Stop(EXCEPTION, self.fault_pc, self.cycles, error)
+        return
+      if ttl is not None:
+        ttl -= count - remaining
+      resume = reason == BREAKPOINT
+      if reason == BUDGET and not ((ttl is not None and ttl <= 0) or
+                                   (cycle_limit is not None and self.cycles >= cycle_limit)):
+        # only the slice is used up
+        reason = DEADLINE if deadline is not None and time.monotonic() >= deadline else SLICE
+      yield Stop(reason, self.pc, self.cycles)
+      if reason not in (SLICE, BREAKPOINT):
+        return
+
+  async def run_async(self, slice = 1000, **options):
+    """run_iter() for asyncio: lets other tasks run between slices; returns the first Stop that is not SLICE.
+
+    Awaiting run_async() again after a BREAKPOINT continues past it.
+    """
+    import asyncio
+
+    for stop in self.run_iter(slice, **options):
+      if stop.reason != SLICE:
+        return stop
+      await asyncio.sleep(0)
+
+  def _run(self, ttl, accelerate = False, fuse = False, breakpoints = None, resume = True, profiler = None):
+    """Main loop of run(), run_iter(), multicore.System and the profiler; returns (stop reason, remaining ttl).
+
+    resume lets the instruction at the starting PC run even if it is a breakpoint.
+    A profiler.Profiler is only called after the words in Profiler.CONTROL_FLOW
+    (CALL, RET, RETI, POP PC, MV PC), on interrupt entry and every
+    profiler.interval instructions; profiling turns off loop acceleration and
+    fusion so that no instruction is skipped.
+    """
+    if profiler is not None:
+      accelerate = fuse = False
+      control_flow = profiler.CONTROL_FLOW
+      sample_at = self.cycles + profiler.interval - 1
+    accelerate = accelerate and not breakpoints  # a skipped loop could step over a breakpoint
+    if accelerate:
+      import accelerator  # fast-forwards counted and idle loops
+      fast_forward, loop_heads = accelerator.fast_forward, accelerator.LOOP_HEADS
+    if fuse:
+      import fusion  # superinstructions
+      fused_step, fusion_heads = fusion.fused_step, fusion.FUSION_HEADS
+    registers = self.registers
+    cycles = start = self.cycles
+    pc = registers[0xE]
+    try:
+      deadline = self._service_events(profiler) if self.scheduler is not None else float('inf')
+      while ttl > 0:
+        if cycles >= deadline:
+          self.cycles = cycles
+          deadline = self._service_events(profiler)
+        pc = registers[0xE]  # kept for fault_pc: instructions change PC before they raise
+        if breakpoints and pc in breakpoints and (cycles != start or not resume):
+          return BREAKPOINT, ttl
+        instruction = self.fetch()
+        if accelerate and (instruction >> 12) in loop_heads:
+          # never skip past the next device event
+          skipped = fast_forward(self, instruction, min(ttl, deadline - cycles))
+          if skipped:
+            ttl -= skipped
+            cycles += skipped
+            continue
+        if fuse and (instruction >> 12) in fusion_heads:
+          # never fuse across the next device event
+          executed = fused_step(self, instruction, min(ttl, deadline - cycles), breakpoints)
+        else:
+          executed = 0
+        if not executed:
+          if profiler is None:
+            self.decode_and_execute(instruction)
+          else:
+            self.decode_and_execute(instruction)
+            if instruction in control_flow:
+              profiler.control_flow(instruction, self.pc, self.lr)
+            if cycles >= sample_at:  # this instruction completes an interval
+              sample_at += profiler.interval
+              profiler.sample()
+          executed = 1
+
+        cycles += executed
+        ttl -= executed
+        # halt condition
+        if self.pc > 0xFFF4:
+          return HALT, ttl
+    except Exception:
+      self.fault_pc = pc
+      raise
+    finally:
+      self.cycles = cycles
+    return BUDGET, ttl
+
+  def _run_coverage(self, ttl, coverage, breakpoints = None):
+    """run() loop that records executed PCs and branch outcomes in an asmcov.Coverage; returns (stop reason, remaining ttl)."""
+    executed, taken, not_taken = coverage.executed, coverage.taken, coverage.not_taken
+    cycles = start = self.cycles
+    deadline = self._service_events() if self.scheduler is not None else float('inf')
+    try:
+      while ttl > 0:
+        if cycles >= deadline:
+          self.cycles = cycles
+          deadline = self._service_events()
+        pc = self.pc
+        if breakpoints and pc in breakpoints and cycles != start:
+          return BREAKPOINT, ttl
+        instruction = self.fetch()
+        index = (pc >> 4) & 0xFFF
+        bit = 1 << ((pc >> 1) & 0x7)
+        executed[index] |= bit
+        branch = instruction >> 13 == 0x7 and isa.decode(instruction)[0]
+        if branch:  # BO*, BA*: the outcome follows from FL before the jump, not from the new PC
+          mask, expected = isa.CONDITION_TESTS[branch.condition]
+          outcome = taken if self.registers[0xF] & mask == expected else not_taken
+        self.decode_and_execute(instruction)
+        if branch:
+          outcome[index] |= bit
+
+        cycles += 1
+        ttl -= 1
+        # halt condition
+        if self.pc > 0xFFF4:
+          return HALT, ttl
+    finally:
+      self.cycles = cycles
+    return BUDGET, ttl
+
+  def _service_events(self, profiler = None):
+    """Fire due device events and enter a pending interrupt; returns the cycle to check again at."""
+    self.scheduler.run_due(self.cycles)
+    interrupts = self.interrupts
+    if interrupts is not None and interrupts.pending:
+      if interrupts.service() and profiler is not None:
+        profiler.interrupt(self.pc, self.lr)
+      if interrupts.pending:
+        return self.cycles + 1  # masked or still pending: check after the next instruction
+    return self.scheduler.next_deadline()
 
   def read_byte(self, address):
     return self.memory[address] & 0xFF
@@ -363,14 +637,14 @@ class CPU:
     self.p = 1 if (result != 0 and not (result & 0x8000)) else 0
 
   def print_registers(self):
-    print("\033[34m--- printing contents of registers ---\033[0m")
+    print(colored("--- printing contents of registers ---", 34))
     for i, reg_name in enumerate(['R1', 'R2', 'R3', 'R4', 'R5', 'R6', 'R7', 'R8', 'R9', 'R10', 'R11', 'IO', 'LR', 'SP', 'PC', 'FL']):
       value_dec = self.registers[i]       # Decimal value
       value_hex = hex(self.registers[i])  # Hexadecimal value
       print(f"{reg_name: <4}: {value_dec: >10}  {value_hex: >10}")
 
   def print_registers_dense(self):
-    print("\033[34m--- printing contents of registers ---\033[0m")
+    print(colored("--- printing contents of registers ---", 34))
     for i in range(0, 16, 4):  # Process 4 registers at a time
       line = ""
       for j in range(4):
@@ -381,7 +655,7 @@ class CPU:
       print(line)
 
   def print_flags(self):
-    print("\033[34m--- printing flags ---\033[0m")  # Blue heading
+    print(colored("--- printing flags ---", 34))  # Blue heading
     print(f"Z: {self.z}   N: {self.n}   P: {self.p}   C: {self.c}   V: {self.v}")
 
   def detect_register_changes(self, old_registers):
@@ -409,59 +683,61 @@ class CPU:
       print("--- start evaluation of registers ---")
     if r1 != None and r1 != self.registers[0x0]:
       error = True
-      print(f"\033[31m[error]\033[0m R1 doesnt match: specified: {r1} -- actual: {self.registers[0x0]}")
+      print(colored("[error]", 31), f"R1 doesnt match: specified: {r1} -- actual: {self.registers[0x0]}")
     if r2 != None and r2 != self.registers[0x1]:
       error = True
-      print(f"\033[31m[error]\033[0m R2 doesnt match: specified: {r2} -- actual: {self.registers[0x1]}")
+      print(colored("[error]", 31), f"R2 doesnt match: specified: {r2} -- actual: {self.registers[0x1]}")
     if r3 != None and r3 != self.registers[0x2]:
       error = True
-      print(f"\033[31m[error]\033[0m R3 doesnt match: specified: {r3} -- actual: {self.registers[0x2]}")
+      print(colored("[error]", 31), f"R3 doesnt match: specified: {r3} -- actual: {self.registers[0x2]}")
     if r4 != None and r4 != self.registers[0x3]:
       error = True
-      print(f"\033[31m[error]\033[0m R4 doesnt match: specified: {r4} -- actual: {self.registers[0x3]}")
+      print(colored("[error]", 31), f"R4 doesnt match: specified: {r4} -- actual: {self.registers[0x3]}")
     if r5 != None and r5 != self.registers[0x4]:
       error = True
-      print(f"\033[31m[error]\033[0m R5 doesnt match: specified: {r5} -- actual: {self.registers[0x4]}")
+      print(colored("[error]", 31), f"R5 doesnt match: specified: {r5} -- actual: {self.registers[0x4]}")
     if r6 != None and r6 != self.registers[0x5]:
       error = True
-      print(f"\033[31m[error]\033[0m R6 doesnt match: specified: {r6} -- actual: {self.registers[0x5]}")
+      print(colored("[error]", 31), f"R6 doesnt match: specified: {r6} -- actual: {self.registers[0x5]}")
     if r7 != None and r7 != self.registers[0x6]:
       error = True
-      print(f"\033[31m[error]\033[0m R7 doesnt match: specified: {r7} -- actual: {self.registers[0x6]}")
+      print(colored("[error]", 31), f"R7 doesnt match: specified: {r7} -- actual: {self.registers[0x6]}")
     if r8 != None and r8 != self.registers[0x7]:
       error = True
-      print(f"\033[31m[error]\033[0m R8 doesnt match: specified: {r8} -- actual: {self.registers[0x7]}")
+      print(colored("[error]", 31), f"R8 doesnt match: specified: {r8} -- actual: {self.registers[0x7]}")
     if r9 != None and r9 != self.registers[0x8]:
       error = True
-      print(f"\033[31m[error]\033[0m R9 doesnt match: specified: {r9} -- actual: {self.registers[0x8]}")
+      print(colored("[error]", 31), f"R9 doesnt match: specified: {r9} -- actual: {self.registers[0x8]}")
     if r10 != None and r10 != self.registers[0x9]:
       error = True
-      print(f"\033[31m[error]\033[0m R10 doesnt match: specified: {r10} -- actual: {self.registers[0x9]}")
+      print(colored("[error]", 31), f"R10 doesnt match: specified: {r10} -- actual: {self.registers[0x9]}")
     if r11 != None and r11 != self.registers[0xA]:
       error = True
-      print(f"\033[31m[error]\033[0m R11 doesnt match: specified: {r11} -- actual: {self.registers[0xA]}")
+      print(colored("[error]", 31), f"R11 doesnt match: specified: {r11} -- actual: {self.registers[0xA]}")
     if io != None and io != self.io:
       error = True
-      print(f"\033[31m[error]\033[0m IO doesnt match: specified: {io} -- actual: {self.io}")
+      print(colored("[error]", 31), f"IO doesnt match: specified: {io} -- actual: {self.io}")
     if lr != None and lr != self.lr:
       error = True
-      print(f"\033[31m[error]\033[0m LR doesnt match: specified: {lr} -- actual: {self.lr}")
+      print(colored("[error]", 31), f"LR doesnt match: specified: {lr} -- actual: {self.lr}")
     if sp != None and sp != self.sp:
       error = True
-      print(f"\033[31m[error]\033[0m SP doesnt match: specified: {sp} -- actual: {self.sp}")
+      print(colored("[error]", 31), f"SP doesnt match: specified: {sp} -- actual: {self.sp}")
     if pc != None and pc != self.pc:
       error = True
-      print(f"\033[31m[error]\033[0m PC doesnt match: specified: {pc} -- actual: {self.pc}")
+      print(colored("[error]", 31), f"PC doesnt match: specified: {pc} -- actual: {self.pc}")
     if fl != None and fl != self.fl:
       error = True
-      print(f"\033[31m[error]\033[0m FL doesnt match: specified: {fl} -- actual: {self.fl}")
+      print(colored("[error]", 31), f"FL doesnt match: specified: {fl} -- actual: {self.fl}")
     if error == False and output:
-      print("\033[32m[passed]\033[0m no errors")
+      print(colored("[passed]", 32), "no errors")
     if error and halt:
       raise ValueError("Invalid register content")
     return error
   
   def stepwise_run(self):
+    import disassembler  # only needed by the interactive debugger
+
     cycle_count = 0
     print_changes = True
 
@@ -489,7 +765,7 @@ class CPU:
           self.decode_and_execute(instruction)
           cycle_count += 1  # Increment cycle count by 1
           if self.pc > 0xFFF4:
-            print("\033[31m[halt]\033[0m reached 0xFFF4 with PC")
+            print(colored("[halt]", 31), "reached 0xFFF4 with PC")
             break
       elif user_input.lower() == 'r':
         # Print registers dense
@@ -531,24 +807,75 @@ class CPU:
 
       # Print changed registers
       if changed_registers and print_changes:
-        print("\033[33m--- Registers changed ---\033[0m")
+        print(colored("--- Registers changed ---", 33))
         for reg in changed_registers:
           reg_name = ['R1', 'R2', 'R3', 'R4', 'R5', 'R6', 'R7', 'R8', 'R9', 'R10', 'R11', 'IO', 'LR', 'SP', 'PC', 'FL'][reg]
           print(f"  {reg_name}: {self.registers[reg]} (0x{self.registers[reg]:X})")
 
       # Print changed flags
       if changed_flags and print_changes:
-        print("\033[38;5;214m--- Flags changed ---\033[0m")
+        print(colored("--- Flags changed ---", "38;5;214"))
         for flag in changed_flags:
           print(f"  {flag.upper()} flag changed to {getattr(self, flag)}")
 
       # Optional halt condition (e.g., if PC reaches 0xFFF4)
       if self.pc > 0xFFF4:
-        print("\033[31m[halt]\033[0m reached 0xFFF4 with PC")
+        print(colored("[halt]", 31), "reached 0xFFF4 with PC")
         break
 
 
+# Decoded instructions: word -> (CPU method, operands), filled in on first use
+_decoded = {}
+
+def _decode(instruction):
+  spec, operands = isa.decode(instruction)
+  if spec is None:
+    entry = (CPU.op_nop, ())  # words that are no instruction do nothing
+  elif spec.condition is not None:
+    entry = (CPU.op_jump, (operands[0], spec.condition, spec.name.startswith('BO')))
+  else:
+    entry = (getattr(CPU, 'op_' + spec.name.lower()), operands)
+  _decoded[instruction] = entry
+  return entry
+
 # Helper functions
 def sign_extend(value, bits):
   sign_bit = 1 << (bits - 1)
-  return (value & (sign_bit - 1)) - (value & sign_bit)
\ No newline at end of file
+  return (value & (sign_bit - 1)) - (value & sign_bit)
+
+if __name__ == "__main__":
+  # Check the bulk memory APIs (load_block/dump_block/memory_view) on flat and
+  # paged memory; the NumPy parts only if numpy is installed
+  import array
+
+  import pagedmem
+
+  try:
+    import numpy
+  except ImportError:
+    numpy = None
+
+  rom = pagedmem.SharedROM(bytes(range(256)) * 4)
+  for name, machine in (('flat', CPU()), ('paged', CPU(rom=rom))):
+    machine.load_block(0x4000, [0x1234, 0xABCD])
+    machine.load_block(0x4010, array.array('H', [7, 8]))
+    machine.load_block(0x4020, b'\x12\x34')
+    assert list(machine.dump_block(0x4000, 2)) == [0x1234, 0xABCD], name
+    assert list(machine.dump_block(0x4010, 2)) == [7, 8], name
+    assert machine.read_word(0x4020) == 0x1234, name
+    if numpy is None:
+      print(f"{name}: ok (numpy not installed, NumPy checks skipped)")
+      continue
+
+    for dtype in (numpy.uint16, '>u2', numpy.int64):
+      machine.load_block(0x4100, numpy.array([0x0102, 0xFFFE], dtype=dtype))
+      assert list(machine.dump_block(0x4100, 2)) == [0x0102, 0xFFFE], (name, dtype)
+    view = machine.memory_view(0x4100, 2)
+    assert view.tolist() == [0x0102, 0xFFFE], name
+    machine.write_word(0x4100, 0x5555)
+    if name == 'flat':
+      assert view.flags.writeable and view.tolist() == [0x5555, 0xFFFE], name  # shares memory
+    else:
+      assert not view.flags.writeable and view.tolist() == [0x0102, 0xFFFE], name  # snapshot
+      assert machine.memory_view(0, 2).tolist() == [0x0001, 0x0203], name  # ROM pages
+    print(f"{name}: ok")
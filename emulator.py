@@ -1,6 +1,7 @@
-import cpu, assembler
+import cpu, build
 
-assembler.assemble_file('assembly.txt', 'binary.txt')
+# Assembles only when assembly.txt changed since the last run
+image = build.load_image('assembly.txt')
 
 cpu = cpu.CPU()
 
@@ -8,7 +9,7 @@ cpu = cpu.CPU()
 cpu.reset()
 
 # Load the program into memory starting at address 0
-cpu.load_program_from_file('binary.txt')
+cpu.load_image(image)
 
 # Run the CPU
 # cpu.run(ttl=0xFF)
@@ -0,0 +1,165 @@
+# fusion.py
+#
+# Superinstructions for CPU.run(fuse=True). Assembled code is dominated by a
+# few fixed sequences, which are executed as one operation each:
+#
+#   asm.mv rA, #imm16     MVL rA, #lo / MVH rA, #hi
+#   asm.call @label       MVL IO, #lo / MVH IO, #hi / CALL #imm8
+#   conditional test      SET rA / BO.cond #imm8
+#
+# Groups are recognised by their instruction words, which are re-read from
+# memory every time, so a self-modifying write simply makes a group stop
+# matching. A group is only fused if executing it one instruction at a time
+# would run all of it: the ttl and the next device event leave room for every
+# instruction, no intermediate PC is a breakpoint or past the 0xFFF4 halt
+# address, and nothing in it raises. Otherwise fused_step() returns 0 and the
+# CPU executes the instruction on its own. Single-stepping, coverage and the
+# profiler never fuse.
+#
+# `python fusion.py` checks fused against plain execution on random programs.
+
+import random
+import sys
+
+import isa
+
+# Opcodes that can start a group (MVL, SET)
+FUSION_HEADS = (0x4, 0xC)
+
+MOVE = 0
+SET_BRANCH = 1
+
+_CALL = isa.BY_NAME['CALL']
+
+_groups = {}  # (first word << 16) | second word -> group, or None if the pair does not fuse
+
+def _group(pair):
+  first, first_operands = isa.decode(pair >> 16)
+  second, second_operands = isa.decode(pair & 0xFFFF)
+  if first is None or second is None:
+    return None
+  if first.name == 'MVL' and second.name == 'MVH':
+    ra, low = first_operands
+    rb, high = second_operands
+    if ra != rb or ra == 0xE:  # MVL PC jumps away before the MVH
+      return None
+    return (MOVE, ra, ((high & 0xFF) << 8) | (low & 0xFF))
+  if first.name == 'SET' and second.condition is not None and second.name.startswith('BO'):
+    imm8 = second_operands[0]
+    if imm8 & 0x1 or first_operands[0] == 0xE:  # raises / SET PC sees the incremented PC
+      return None
+    mask, expected = isa.CONDITION_TESTS[second.condition]
+    return (SET_BRANCH, first_operands[0], mask, expected, imm8)
+  return None
+
+def fused_step(machine, instruction, budget, breakpoints=None):
+  """Execute the group starting at machine.pc in one go; returns the instructions executed (0 if none)."""
+  registers = machine.registers
+  pc = registers[0xE]
+  # a halt, breakpoint, the ttl or a device event between the first two instructions prevents fusion
+  if budget < 2 or pc + 2 > 0xFFF4 or (breakpoints and pc + 2 in breakpoints):
+    return 0
+  memory = machine.memory
+  pair = (instruction << 16) | (memory[pc + 2] << 8) | memory[pc + 3]
+  try:
+    group = _groups[pair]
+  except KeyError:
+    group = _groups[pair] = _group(pair)
+  if group is None:
+    return 0
+
+  if group[0] == MOVE:
+    _, ra, value = group
+    if ra == 0xB and budget >= 3 and pc + 4 <= 0xFFF4 and not (breakpoints and pc + 4 in breakpoints):
+      call = (memory[pc + 4] << 8) | memory[pc + 5]
+      if call & _CALL.mask == _CALL.value:
+        imm8 = call & 0xFF
+        if imm8 & 0x80:
+          imm8 -= 0x100
+        registers[0xB] = value
+        registers[0xC] = pc + 6
+        registers[0xE] = value + imm8
+        return 3
+    registers[ra] = value
+    registers[0xE] = pc + 4
+    return 2
+
+  _, ra, mask, expected, imm8 = group
+  target = pc + 4 + imm8
+  if target > 0xFFFF or target < 0x0000:  # a taken branch would raise
+    return 0
+  # SET: Z, N and P of rA, as CPU.set_flags
+  value = registers[ra]
+  fl = registers[0xF] & ~0x7
+  if value == 0:
+    fl |= 0x1
+  elif value & 0x8000:
+    fl |= 0x2
+  else:
+    fl |= 0x4
+  registers[0xF] = fl
+  registers[0xE] = target if fl & mask == expected else pc + 4
+  return 2
+
+def random_program(rng):
+  """Random program made of fusable groups and the odd disturbance, plus a setup function."""
+  import build
+
+  words = []
+  for _ in range(rng.randrange(1, 10)):
+    kind = rng.randrange(6)
+    ra = rng.choice([0, 1, 2, 0xB, 0xB, 0xE, 0xF])
+    if kind == 0:  # asm.mv
+      words += [isa.encode('MVL', ra, rng.randrange(-128, 128)), isa.encode('MVH', ra, rng.randrange(-128, 128))]
+    elif kind == 1:  # asm.call into the program
+      target = 2 * rng.randrange(12)
+      words += [isa.encode('MVL', 0xB, target), isa.encode('MVH', 0xB, 0), isa.encode('CALL', rng.choice([0, 0, 2, -2]))]
+    elif kind == 2:  # conditional test
+      imm8 = rng.choice([0, 2, 4, -4, -8, rng.randrange(-128, 128)])
+      words += [isa.encode('SET', ra), isa.encode('BO' + rng.choice(['', '.Z', '.NZ', '.C', '.V', '.N', '.P']), imm8)]
+    elif kind == 3:  # self-modifying store into the program
+      words += [isa.encode('SW', rng.choice([0, 1, 2]), 2 * rng.randrange(-8, 8))]
+    elif kind == 4:
+      words += [isa.encode('ADD', rng.choice([0, 1, 2]), (True, rng.randrange(-32, 32)))]
+    else:  # a lone MVL or SET
+      words += [rng.choice([isa.encode('MVL', ra, 1), isa.encode('SET', ra)])]
+  words += [0x4BF6, 0x5BFF, 0xF000]  # MVL IO, #0xF6 / MVH IO, #0xFF / BA #0 halts
+  state = {r: rng.choice([0, 1, 0x8000, 0xFFFF, rng.randrange(0x10000)]) for r in (0, 1, 2)}
+  state[0xB] = 2 * rng.randrange(8)
+  state[0xF] = rng.randrange(0x40)  # interrupts enabled half the time
+  # sometimes run just below the halt address instead of at 0, or with a timer interrupt
+  start = rng.choice([0, 0, 0, 0xFFF4 - 2 * rng.randrange(4)])
+  period, handler = rng.choice([None, None, rng.randrange(1, 8)]), 2 * rng.randrange(len(words))
+
+  def setup(machine):
+    if start:
+      machine.load_block(start, words[:(0x10000 - start) // 2])
+      machine.pc = start
+    for r, value in state.items():
+      machine.registers[r] = value
+    if period:
+      import interrupts
+      interrupts.InterruptController(machine).set_vector(0, handler)
+      interrupts.Timer(machine, line=0).start(period)
+
+  return build.words_to_image(words), setup
+
+if __name__ == "__main__":
+  # Differential test mode: plain and fused runs must agree exactly
+  import accelerator
+
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+  rng = random.Random(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+  failures = 0
+  for i in range(count):
+    image, setup = random_program(rng)
+    ttl = rng.choice([1, 2, 3, 4, 5, 7, 100, rng.randrange(1, 1000)])
+    breakpoints = set(rng.sample(range(0, 40, 2), rng.choice([0, 0, 1, 3])))
+    differences = accelerator.differential_run(image, ttl, setup, fuse=True, breakpoints=breakpoints)
+    if differences:
+      failures += 1
+      print(f"case {i}: image {image.hex()} ttl {ttl} breakpoints {sorted(breakpoints)}")
+      for difference in differences:
+        print(f"  {difference}")
+  print(f"{count - failures}/{count} programs identical")
+  sys.exit(1 if failures else 0)
@@ -0,0 +1,92 @@
+# interrupts.py
+#
+# Interrupt controller and programmable timer.
+#
+#   machine = cpu.CPU()
+#   controller = interrupts.InterruptController(machine)
+#   controller.set_vector(0, handler_address)
+#   timer = interrupts.Timer(machine, line=0)
+#   timer.start(period=1000)
+#
+# Taking interrupt line n (only while the IE bit of FL is set):
+#   push LR; push FL; LR <- PC; clear IE; PC <- mem[vector_base + 2*n]
+# RETI undoes it:
+#   PC <- LR; pop FL; pop LR
+
+import scheduler
+
+IE = 1 << 5  # interrupt enable, bit 5 of FL
+VECTOR_BASE = 0x3FE0  # 16 handler addresses at the top of ROM
+LINES = 16
+
+class InterruptController:
+  def __init__(self, machine, vector_base=VECTOR_BASE):
+    self.machine = machine
+    self.vector_base = vector_base
+    self.pending = 0  # bit n set = line n pending
+    if machine.scheduler is None:
+      machine.scheduler = scheduler.EventScheduler()
+    machine.interrupts = self
+
+  def set_vector(self, line, address):
+    """Store the handler address of line in the vector table."""
+    self.machine.write_word(self.vector_base + 2*line, address)
+
+  def raise_irq(self, line):
+    if not 0 <= line < LINES:
+      raise ValueError(f"Interrupt line {line} out of range (0-{LINES - 1}).")
+    self.pending |= 1 << line
+
+  def clear_irq(self, line):
+    self.pending &= ~(1 << line)
+
+  def service(self):
+    """Enter the handler of the highest priority (lowest) pending line if interrupts are enabled.
+
+    Returns whether a handler was entered.
+    """
+    machine = self.machine
+    if not self.pending or not machine.fl & IE:
+      return False
+    line = (self.pending & -self.pending).bit_length() - 1
+    self.pending &= ~(1 << line)
+    machine.sp -= 2
+    machine.write_word(machine.sp, machine.lr)
+    machine.sp -= 2
+    machine.write_word(machine.sp, machine.fl)
+    machine.lr = machine.pc
+    machine.fl &= ~IE
+    machine.pc = machine.read_word(self.vector_base + 2*line)
+    return True
+
+class Timer:
+  """Raises an interrupt line every `period` cycles (or once, if not periodic)."""
+
+  def __init__(self, machine, line=0):
+    if machine.interrupts is None:
+      InterruptController(machine)
+    self.machine = machine
+    self.line = line
+    self.period = None
+    self.periodic = False
+    self._event = None
+
+  def start(self, period, periodic=True):
+    if period < 1:
+      raise ValueError(f"Timer period must be at least 1 cycle, got {period}.")
+    self.stop()
+    self.period = period
+    self.periodic = periodic
+    self._event = self.machine.scheduler.schedule(self.machine.cycles + period, self._expire)
+
+  def stop(self):
+    if self._event is not None:
+      self.machine.scheduler.cancel(self._event)
+      self._event = None
+
+  def _expire(self, time):
+    self.machine.interrupts.raise_irq(self.line)
+    if self.periodic:
+      self._event = self.machine.scheduler.schedule(time + self.period, self._expire)
+    else:
+      self._event = None
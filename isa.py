@@ -0,0 +1,188 @@
+# isa.py
+#
+# Single source of truth for the instruction set (see design.txt). The
+# assembler, disassembler and CPU decoder are all driven by INSTRUCTIONS;
+# adding an instruction means adding a row here (plus its semantics in cpu.py).
+#
+# Encoders, decoders and disassembly formatters are derived from the table when
+# the module is imported. Decoding a word is a mask/compare against the few
+# candidates sharing its top nibble; results are memoized per word.
+
+# Operand formats: (kind, lowest bit, width) per operand field
+#   reg       register number
+#   imm       signed two's complement immediate
+#   reg/imm   register or immediate, selected by the I bit (IMM_BIT); the
+#             immediate is written signed, but executes zero-extended (design.txt)
+FORMATS = {
+  'rA, rB/#imm6': (('reg', 6, 4), ('reg/imm', 0, 6)),
+  'rA, rB':       (('reg', 4, 4), ('reg', 0, 4)),
+  'rA_':          (('reg', 4, 4),),  # rA in bits 4-7, low nibble unused (NOT)
+  'rA, #imm8':    (('reg', 8, 4), ('imm', 0, 8)),
+  'rA':           (('reg', 0, 4),),
+  '#imm8':        (('imm', 0, 8),),
+  '':             (),
+}
+IMM_BIT = 10
+
+# mnemonic, opcode bits (from bit 15 down), operand format
+INSTRUCTIONS = [
+  # arithmetic
+  ('ADD',   '10000',         'rA, rB/#imm6'),
+  ('ADC',   '10001',         'rA, rB/#imm6'),
+  ('SUB',   '10010',         'rA, rB/#imm6'),
+  ('AND',   '10011000',      'rA, rB'),
+  ('OR',    '10011001',      'rA, rB'),
+  ('NOT',   '10011010',      'rA_'),
+  ('XOR',   '10011011',      'rA, rB'),
+  ('SLL',   '10011100',      'rA, rB'),
+  ('SRL',   '10011101',      'rA, rB'),
+  ('SRA',   '10011110',      'rA, rB'),
+  # io
+  ('LB',    '0010',          'rA, #imm8'),
+  ('LW',    '0011',          'rA, #imm8'),
+  ('SB',    '0110',          'rA, #imm8'),
+  ('SW',    '0111',          'rA, #imm8'),
+  ('MV',    '0001',          'rA, rB'),
+  ('MVL',   '0100',          'rA, #imm8'),
+  ('MVH',   '0101',          'rA, #imm8'),
+  ('TAS',   '1010',          'rA, #imm8'),
+  # control
+  ('SET',   '110000000000',  'rA'),
+  ('PUSH',  '110000000010',  'rA'),
+  ('POP',   '110000000011',  'rA'),
+  ('CALL',  '11000001',      '#imm8'),
+  ('RET',   '110000000001',  ''),
+  ('RETI',  '110000000100',  ''),
+  ('NOP',   '0000000000000', ''),
+  # jump
+  ('BO',    '11100000',      '#imm8'),
+  ('BO.Z',  '11100001',      '#imm8'),
+  ('BO.NZ', '11100010',      '#imm8'),
+  ('BO.C',  '11100011',      '#imm8'),
+  ('BO.V',  '11100100',      '#imm8'),
+  ('BO.N',  '11100101',      '#imm8'),
+  ('BO.P',  '11100110',      '#imm8'),
+  ('BA',    '11110000',      '#imm8'),
+  ('BA.Z',  '11110001',      '#imm8'),
+  ('BA.NZ', '11110010',      '#imm8'),
+  ('BA.C',  '11110011',      '#imm8'),
+  ('BA.V',  '11110100',      '#imm8'),
+  ('BA.N',  '11110101',      '#imm8'),
+  ('BA.P',  '11110110',      '#imm8'),
+]
+
+REGISTER_NAMES = ['R1', 'R2', 'R3', 'R4', 'R5', 'R6', 'R7', 'R8', 'R9', 'R10', 'R11', 'IO', 'LR', 'SP', 'PC', 'FL']
+REGISTER_NUMBERS = {name: number for number, name in enumerate(REGISTER_NAMES)}
+REGISTER_NUMBERS.update({f"R{number + 1}": number for number in range(11, 16)})  # R12-R16 aliases
+CONDITIONS = ['', 'Z', 'NZ', 'C', 'V', 'N', 'P']  # condition code = index, bits 8-10 of BO*/BA*
+# Condition code -> (FL mask, expected FL & mask) for the condition to hold
+CONDITION_TESTS = [(0x00, 0x00), (0x01, 0x01), (0x01, 0x00), (0x08, 0x08), (0x10, 0x10), (0x02, 0x02), (0x04, 0x04)]
+
+class Instruction:
+  """One row of INSTRUCTIONS with its derived encoding."""
+
+  __slots__ = ('name', 'bits', 'format', 'fields', 'mask', 'value', 'condition')
+
+  def __init__(self, name, bits, format):
+    self.name = name
+    self.bits = bits
+    self.format = format
+    self.fields = FORMATS[format]
+    self.mask = ((1 << len(bits)) - 1) << (16 - len(bits))
+    self.value = int(bits, 2) << (16 - len(bits))
+    # BO*/BA* carry their condition code in the opcode
+    base, _, suffix = name.partition('.')
+    self.condition = CONDITIONS.index(suffix) if base in ('BO', 'BA') else None
+
+  def encode(self, *operands):
+    """Encode operand values (registers as numbers, reg/imm as (is_imm, value)) into a word."""
+    if len(operands) != len(self.fields):
+      raise ValueError(f"{self.name} expects {len(self.fields)} operands, got {len(operands)}")
+    word = self.value
+    for (kind, shift, width), operand in zip(self.fields, operands):
+      if kind == 'reg/imm':
+        is_imm, operand = operand
+        if is_imm:
+          word |= 1 << IMM_BIT
+        else:
+          kind, width = 'reg', 4
+      if kind == 'reg':
+        if not 0 <= operand <= 0xF:
+          raise ValueError(f"Unknown register number: {operand}")
+      elif operand < -(1 << (width - 1)) or operand >= (1 << (width - 1)):
+        raise ValueError(f"Immediate value {operand} exceeds the allowed {width}-bit range "
+                         f"({-(1 << (width - 1))} to {(1 << (width - 1)) - 1}).")
+      word |= (operand & ((1 << width) - 1)) << shift
+    return word
+
+  def decode(self, word):
+    """Operand values of word; a reg/imm field yields (is_imm, value)."""
+    operands = []
+    for kind, shift, width in self.fields:
+      if kind == 'reg/imm':
+        if (word >> IMM_BIT) & 0x1:
+          operands.append((True, _signed((word >> shift) & ((1 << width) - 1), width)))
+        else:
+          operands.append((False, (word >> shift) & 0xF))
+      elif kind == 'reg':
+        operands.append((word >> shift) & 0xF)
+      else:
+        operands.append(_signed((word >> shift) & ((1 << width) - 1), width))
+    return tuple(operands)
+
+  def format_operands(self, operands):
+    text = []
+    for (kind, _, _), operand in zip(self.fields, operands):
+      if kind == 'reg/imm':
+        is_imm, operand = operand
+        kind = 'imm' if is_imm else 'reg'
+      text.append(REGISTER_NAMES[operand] if kind == 'reg' else f"#{operand}")
+    return f"{self.name} {', '.join(text)}" if text else self.name
+
+def _signed(value, width):
+  return value - (1 << width) if value & (1 << (width - 1)) else value
+
+BY_NAME = {row[0]: Instruction(*row) for row in INSTRUCTIONS}
+
+# candidates per top nibble, longest (most specific) opcode first
+_BY_NIBBLE = [sorted((i for i in BY_NAME.values() if i.value >> 12 == nibble),
+                     key=lambda i: -len(i.bits)) for nibble in range(16)]
+_decoded = {}
+_text = {}
+
+def decode(word):
+  """Return (Instruction, operands) for a 16-bit word, or (None, ()) if no instruction matches."""
+  try:
+    return _decoded[word]
+  except KeyError:
+    pass
+  result = (None, ())
+  for instruction in _BY_NIBBLE[word >> 12]:
+    if word & instruction.mask == instruction.value:
+      result = (instruction, instruction.decode(word))
+      break
+  _decoded[word] = result
+  return result
+
+def encode(name, *operands):
+  """Encode an instruction by mnemonic, e.g. encode('ADD', 0, (True, -1))."""
+  try:
+    instruction = BY_NAME[name]
+  except KeyError:
+    raise ValueError(f"Unknown instruction: {name}") from None
+  return instruction.encode(*operands)
+
+def disassemble(word):
+  """Assembly text of a 16-bit word ("Unknown instruction" if it does not decode)."""
+  try:
+    return _text[word]
+  except KeyError:
+    pass
+  instruction, operands = decode(word)
+  text = instruction.format_operands(operands) if instruction else "Unknown instruction"
+  _text[word] = text
+  return text
+
+# Bit-string views, kept as the assembler's and disassembler's public maps
+instruction_map = {name: instruction.bits for name, instruction in BY_NAME.items()}
+register_map = {name: format(number, '04b') for name, number in REGISTER_NUMBERS.items()}
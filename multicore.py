@@ -0,0 +1,76 @@
+# multicore.py
+#
+# Several CPU cores on one shared memory:
+#
+#   system = multicore.System(cores=4, quantum=100)
+#   system.load_image(build.load_image('smp.txt'))
+#   system.run()
+#
+# Every core is a cpu.CPU with its own registers and the System's memory
+# bytearray. At reset R1 holds the core id and SP the top of the core's stack
+# region (see design.txt). Cores run round-robin, `quantum` instructions at a
+# time in core order, so the interleaving - and with it every result - only
+# depends on the program and the quantum. TAS synchronizes the cores: it is a
+# single instruction, and no other core runs in the middle of one.
+
+import cpu
+
+STACK_BASE = 0x8000
+STACK_TOP = 0x9FFE
+STACK_SIZE = 0x400  # bytes of stack per core
+MAX_CORES = (STACK_TOP + 2 - STACK_BASE) // STACK_SIZE
+
+class System:
+  def __init__(self, cores=2, quantum=100, entry=0):
+    if not 1 <= cores <= MAX_CORES:
+      raise ValueError(f"Number of cores must be 1 to {MAX_CORES} (one stack region each), got {cores}.")
+    if quantum < 1:
+      raise ValueError(f"Quantum must be at least 1 instruction, got {quantum}.")
+    self.memory = bytearray(0xFFFF + 1)
+    self.quantum = quantum
+    self.entry = entry
+    self.cores = [cpu.CPU(memory=self.memory) for _ in range(cores)]
+    for core_id, core in enumerate(self.cores):
+      self._reset_core(core, core_id)
+
+  def _reset_core(self, core, core_id):
+    core.registers[0x0] = core_id
+    core.sp = STACK_TOP - core_id * STACK_SIZE
+    core.pc = self.entry
+
+  def reset(self):
+    """Reset every core's registers; memory is kept."""
+    for core_id, core in enumerate(self.cores):
+      core.reset()
+      self._reset_core(core, core_id)
+
+  def load_image(self, image, start_address=0):
+    """Load a big-endian byte image into the shared memory."""
+    self.cores[0].load_image(image, start_address)
+
+  def halted(self):
+    """Per core: has PC passed 0xFFF4?"""
+    return [core.pc > 0xFFF4 for core in self.cores]
+
+  def run(self, ttl=None):
+    """Run all cores round-robin until each has halted or executed ttl instructions.
+
+    Returns the total number of instructions executed.
+    """
+    if ttl is None:
+      ttl = 0xFFFF
+    remaining = [ttl] * len(self.cores)
+    quantum = self.quantum
+    executed = 0
+    running = True
+    while running:
+      running = False
+      for core_id, core in enumerate(self.cores):
+        if remaining[core_id] <= 0 or core.pc > 0xFFF4:
+          continue
+        budget = min(quantum, remaining[core_id])
+        count = budget - core._run(budget)[1]
+        remaining[core_id] -= count
+        executed += count
+        running = True
+    return executed
@@ -0,0 +1,70 @@
+# pagedmem.py
+#
+# Paged memory for running many CPU instances in one process:
+#
+#   rom = pagedmem.SharedROM(build.load_image('assembly.txt'))
+#   machines = [cpu.CPU(rom=rom) for _ in range(10000)]
+#
+# The 64K address space is split into 256-byte pages. All instances share the
+# immutable ROM pages (0x0000-0x3FFF) and a single zero page for everything
+# else; a page is copied into a private bytearray the first time an instance
+# writes to it. Reads and writes behave exactly like the flat memory bytearray.
+
+PAGE_BITS = 8
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+PAGE_COUNT = 0x10000 >> PAGE_BITS
+ROM_END = 0x4000
+
+ZERO_PAGE = bytes(PAGE_SIZE)
+
+class SharedROM:
+  """Immutable ROM pages built once from a byte image and shared between CPUs."""
+
+  def __init__(self, image):
+    if len(image) > ROM_END:
+      raise ValueError(f"ROM image of {len(image)} bytes exceeds the ROM region (0x{ROM_END:X} bytes).")
+    image = bytes(image).ljust(ROM_END, b'\0')
+    pages = []
+    for start in range(0, ROM_END, PAGE_SIZE):
+      page = image[start:start + PAGE_SIZE]
+      pages.append(ZERO_PAGE if page == ZERO_PAGE else page)
+    self.pages = tuple(pages)
+
+class PagedMemory:
+  """List-like 64K byte memory with shared pages and private copy-on-write pages."""
+
+  __slots__ = ('pages',)
+
+  def __init__(self, rom=None):
+    rom_pages = rom.pages if rom is not None else (ZERO_PAGE,) * (ROM_END >> PAGE_BITS)
+    self.pages = list(rom_pages) + [ZERO_PAGE] * (PAGE_COUNT - len(rom_pages))
+
+  def __len__(self):
+    return PAGE_COUNT << PAGE_BITS
+
+  def __getitem__(self, address):
+    if isinstance(address, slice):
+      return [self[i] for i in range(*address.indices(len(self)))]
+    return self.pages[address >> PAGE_BITS][address & PAGE_MASK]
+
+  def __setitem__(self, address, value):
+    if isinstance(address, slice):
+      for i, byte in zip(range(*address.indices(len(self))), value):
+        self[i] = byte
+      return
+    index = address >> PAGE_BITS
+    page = self.pages[index]
+    if type(page) is bytes:  # still shared: copy on first write
+      page = self.pages[index] = bytearray(page)
+    page[address & PAGE_MASK] = value
+
+  def __bytes__(self):
+    return b''.join(self.pages)
+
+  def __iter__(self):
+    return iter(bytes(self))
+
+  def private_pages(self):
+    """Number of pages this instance has copied for itself."""
+    return sum(1 for page in self.pages if type(page) is not bytes)
@@ -0,0 +1,96 @@
+# profiler.py
+#
+# Sampling profiler for guest programs.
+#
+#   python cli.py profile assembly.txt --interval 100 -o out.folded
+#   flamegraph.pl out.folded > out.svg
+#
+# The guest call stack is tracked from the instruction stream: CALL (and
+# asm.call) and interrupt entry push a frame that remembers its return
+# address; RET, RETI and any POP/MV that writes PC (e.g. PUSH LR ... POP PC)
+# return to the innermost frame whose return address matches the new PC. As
+# frames are matched by return address, LR saved and restored through
+# PUSH LR/POP LR around nested calls unwinds correctly, and a RET to an
+# unknown address leaves the stack alone.
+#
+# Every `interval` instructions the current stack is sampled. Frames are
+# symbolized through the assembler's labels, and the samples are written in
+# collapsed-stack format ("outer;inner count") for flamegraph tools.
+
+import bisect
+import collections
+
+class Profiler:
+  # Instruction words that can change the call stack; CPU._run only reports these
+  CONTROL_FLOW = frozenset(
+    list(range(0xC100, 0xC200))  # CALL
+    + list(range(0xC010, 0xC020)) + list(range(0xC040, 0xC050))  # RET, RETI
+    + [0xC03E]  # POP PC
+    + [0x10E0 | (bits << 8) | rb for bits in range(16) for rb in range(16)])  # MV PC, rB
+
+  def __init__(self, labels=None, interval=100):
+    if interval < 1:
+      raise ValueError(f"Sampling interval must be at least 1 instruction, got {interval}.")
+    self.interval = interval
+    self.samples = collections.Counter()  # tuple of frame entry addresses -> samples
+    self.frames = None  # [entry address, return address] per frame, outermost first
+    symbols = sorted((address, label) for label, address in (labels or {}).items())
+    self._addresses = [address for address, _ in symbols]
+    self._labels = [label for _, label in symbols]
+    self._symbols = {}
+
+  def symbolize(self, address):
+    """Name of the nearest label at or below address."""
+    name = self._symbols.get(address)
+    if name is None:
+      i = bisect.bisect_right(self._addresses, address) - 1
+      if i < 0:
+        name = f"0x{address:04X}"
+      elif self._addresses[i] == address:
+        name = self._labels[i]
+      else:
+        name = f"{self._labels[i]}+0x{address - self._addresses[i]:X}"
+      self._symbols[address] = name
+    return name
+
+  def _return(self, pc):
+    frames = self.frames
+    for i in range(len(frames) - 1, 0, -1):
+      if frames[i][1] == pc:
+        del frames[i:]
+        return
+
+  def control_flow(self, instruction, pc, lr):
+    """Called by CPU._run after an instruction in CONTROL_FLOW, with PC and LR after it."""
+    if instruction & 0xFF00 == 0xC100:  # CALL
+      self.frames.append([pc, lr])
+    else:  # RET, RETI, POP PC, MV PC
+      self._return(pc)
+
+  def interrupt(self, handler, return_address):
+    """Called by CPU._run when an interrupt handler is entered in front of the next instruction."""
+    self.frames.append([handler, return_address])
+
+  def sample(self):
+    """Count one sample of the current stack."""
+    self.samples[tuple(entry for entry, _ in self.frames)] += 1
+
+  def run(self, machine, ttl=None):
+    """Execute like CPU.run (without output) while sampling; returns the remaining ttl."""
+    if ttl is None:
+      ttl = 0xFFFF
+    if self.frames is None:
+      self.frames = [[machine.pc, None]]
+    _, ttl = machine._run(ttl, profiler=self)
+    return ttl
+
+  def collapsed(self):
+    """Samples in collapsed-stack format, one "frame;frame;frame count" line per stack."""
+    stacks = collections.Counter()
+    for stack, count in self.samples.items():
+      stacks[';'.join(self.symbolize(entry) for entry in stack)] += count
+    return [f"{stack} {count}" for stack, count in sorted(stacks.items())]
+
+  def write_collapsed(self, filename):
+    with open(filename, 'w') as file:
+      file.write('\n'.join(self.collapsed()) + '\n')
@@ -0,0 +1,43 @@
+# scheduler.py
+#
+# Priority-queue event scheduler for timed devices. Events are keyed on the
+# CPU's instruction count (CPU.cycles; every instruction takes one cycle), and
+# CPU.run only compares the count against next_deadline() instead of polling
+# each device after every instruction.
+
+import heapq
+import itertools
+
+NEVER = float('inf')
+
+class EventScheduler:
+  def __init__(self):
+    self._queue = []  # heap of [time, seq, callback]; callback None = cancelled
+    self._seq = itertools.count()
+
+  def schedule(self, time, callback):
+    """Call callback(time) once the cycle count reaches time; returns a handle for cancel()."""
+    event = [time, next(self._seq), callback]
+    heapq.heappush(self._queue, event)
+    return event
+
+  def cancel(self, event):
+    event[2] = None
+
+  def next_deadline(self):
+    """Cycle count of the earliest pending event, or NEVER."""
+    queue = self._queue
+    while queue and queue[0][2] is None:
+      heapq.heappop(queue)
+    return queue[0][0] if queue else NEVER
+
+  def run_due(self, now):
+    """Fire all events due at or before now, in time order (ties in scheduling order)."""
+    queue = self._queue
+    while queue and queue[0][0] <= now:
+      time, _, callback = heapq.heappop(queue)
+      if callback is not None:
+        callback(time)
+
+  def __len__(self):
+    return sum(1 for event in self._queue if event[2] is not None)
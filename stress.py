@@ -0,0 +1,363 @@
+# stress.py
+#
+# Random-instruction stress harness for cpu.decode_and_execute.
+#
+#   python stress.py --programs 100000 --workers 8
+#
+# Every case is a random but valid program (assembled from text by the
+# assembler) plus a random initial state. The CPU runs it in lockstep with
+# ReferenceCPU, which shares the CPU's ALU but decodes every word with its own
+# bit fields transcribed from design.txt (not isa.py, which drives the CPU,
+# assembler and disassembler) and interprets the result. Programs branch
+# forward and run bounded loops counted in R11, so they terminate; the CPU
+# first runs on its own under a ttl, then in lockstep with the reference. A
+# case fails when
+#
+#   exception   the CPU raises and the reference does not (or raises something else)
+#   hang        the CPU exhausts its ttl inside the program, but the reference leaves it
+#   divergence  registers or memory differ from the reference after a step
+#   roundtrip   re-assembling the reference decoding of a word does not give it back
+#
+# Failures are shrunk to a minimal program and grouped by signature.
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import assembler
+import cpu
+
+REGISTERS = [f"R{i}" for i in range(1, 11)]  # generated programs never write IO/LR/SP/PC/FL
+COUNTER = 'R11'  # loop counter, only written by the loops themselves
+MAX_ITERATIONS = 8  # per loop
+CONDITIONS = ['', '.Z', '.NZ', '.C', '.V', '.N', '.P']
+CONDITION_INDEX = {'': 0, 'Z': 1, 'NZ': 2, 'C': 3, 'V': 4, 'N': 5, 'P': 6}
+
+# Encodings transcribed from design.txt, deliberately independent of isa.py
+REGISTER_NAMES = ['R1', 'R2', 'R3', 'R4', 'R5', 'R6', 'R7', 'R8', 'R9', 'R10', 'R11', 'IO', 'LR', 'SP', 'PC', 'FL']
+REGISTER_INDEX = {name: i for i, name in enumerate(REGISTER_NAMES)}
+ARITHMETIC = {0b10000: 'ADD', 0b10001: 'ADC', 0b10010: 'SUB'}              # bits 15-11
+LOGIC = ['AND', 'OR', 'NOT', 'XOR', 'SLL', 'SRL', 'SRA']                     # 10011, bits 10-8
+REG_IMM8 = {0b0010: 'LB', 0b0011: 'LW', 0b0110: 'SB', 0b0111: 'SW',
+            0b0100: 'MVL', 0b0101: 'MVH', 0b1010: 'TAS'}                     # bits 15-12
+CONTROL = {0x0: 'SET', 0x1: 'RET', 0x2: 'PUSH', 0x3: 'POP', 0x4: 'RETI'}     # 11000000, bits 7-4
+JUMPS = {0b1110: 'BO', 0b1111: 'BA'}                                         # bits 15-12, condition in bits 10-8
+
+def _signed(value, bits):
+  return value - (1 << bits) if value & (1 << (bits - 1)) else value
+
+def reference_disassemble(word):
+  """Assembly text of word decoded with design.txt's bit fields, or None if it is no instruction."""
+  rA = REGISTER_NAMES
+  if word >> 11 in ARITHMETIC:
+    name = ARITHMETIC[word >> 11]
+    if (word >> 10) & 0x1:
+      return f"{name} {rA[(word >> 6) & 0xF]}, #{_signed(word & 0x3F, 6)}"
+    return f"{name} {rA[(word >> 6) & 0xF]}, {rA[word & 0xF]}"
+  if word >> 11 == 0b10011:
+    sub_opcode = (word >> 8) & 0x7
+    if sub_opcode == 0x7:
+      return None
+    if LOGIC[sub_opcode] == 'NOT':
+      return f"NOT {rA[(word >> 4) & 0xF]}"
+    return f"{LOGIC[sub_opcode]} {rA[(word >> 4) & 0xF]}, {rA[word & 0xF]}"
+  if word >> 12 in REG_IMM8:
+    return f"{REG_IMM8[word >> 12]} {rA[(word >> 8) & 0xF]}, #{_signed(word & 0xFF, 8)}"
+  if word >> 12 == 0b0001:
+    return f"MV {rA[(word >> 4) & 0xF]}, {rA[word & 0xF]}"
+  if word >> 8 == 0b11000000 and (word >> 4) & 0xF in CONTROL:
+    name = CONTROL[(word >> 4) & 0xF]
+    return name if name in ('RET', 'RETI') else f"{name} {rA[word & 0xF]}"
+  if word >> 8 == 0b11000001:
+    return f"CALL #{_signed(word & 0xFF, 8)}"
+  if word >> 3 == 0:
+    return "NOP"
+  if word >> 12 in JUMPS and not (word >> 11) & 0x1 and (word >> 8) & 0x7 != 0x7:
+    return f"{JUMPS[word >> 12]}{CONDITIONS[(word >> 8) & 0x7]} #{_signed(word & 0xFF, 8)}"
+  return None
+
+class ReferenceCPU(cpu.CPU):
+  """CPU that decodes with reference_disassemble, following design.txt."""
+
+  def decode_and_execute(self, instruction):
+    self.pc += 2
+    text = reference_disassemble(instruction)
+    if text is None:
+      return  # no such instruction: nothing happens
+    mnemonic, _, rest = text.partition(' ')
+    operands = [operand.strip() for operand in rest.split(',')] if rest else []
+    values = [int(op[1:]) if op.startswith('#') else REGISTER_INDEX[op] for op in operands]
+    name, _, condition = mnemonic.partition('.')
+    regs = self.registers
+
+    if name in ('ADD', 'ADC', 'SUB'):
+      ra = values[0]
+      b = values[1] & 0x3F if operands[1].startswith('#') else regs[values[1]]  # imm6 zero-extended
+      if name == 'SUB':
+        regs[ra] = self.alu_sub(regs[ra], b)
+      else:
+        regs[ra] = self.alu_add(regs[ra], b, with_carry=name == 'ADC')
+    elif name in ('AND', 'OR', 'XOR'):
+      alu = {'AND': self.alu_and, 'OR': self.alu_or, 'XOR': self.alu_xor}[name]
+      regs[values[0]] = alu(regs[values[0]], regs[values[1]])
+    elif name == 'NOT':
+      regs[values[0]] = self.alu_not(regs[values[0]])
+    elif name in ('SLL', 'SRL', 'SRA'):
+      direction = 'left' if name == 'SLL' else 'right'
+      regs[values[0]] = self.alu_shift(regs[values[0]], regs[values[1]], direction, arithmetic=name == 'SRA')
+    elif name in ('LB', 'LW', 'SB', 'SW', 'TAS'):
+      address = (self.io + values[1]) & 0xFFFF
+      if name in ('LW', 'SW', 'TAS') and address % 2 != 0:
+        raise ValueError("Access to an odd address is not allowed: 0x{:X}".format(address))
+      if name == 'LB':
+        regs[values[0]] = self.read_byte(address)
+      elif name == 'LW':
+        regs[values[0]] = self.read_word(address)
+      elif name == 'TAS':
+        regs[values[0]] = self.read_word(address)
+        self.write_word(address, 1)
+      elif name == 'SB':
+        self.write_byte(address, regs[values[0]])
+      else:
+        self.write_word(address, regs[values[0]])
+    elif name == 'MV':
+      regs[values[0]] = regs[values[1]]
+    elif name == 'MVL':
+      regs[values[0]] = (regs[values[0]] & 0xFF00) | (values[1] & 0xFF)
+    elif name == 'MVH':
+      regs[values[0]] = (regs[values[0]] & 0x00FF) | ((values[1] & 0xFF) << 8)
+    elif name == 'SET':
+      self.set_flags(regs[values[0]])
+    elif name == 'PUSH':
+      self.sp -= 2
+      self.write_word(self.sp, regs[values[0]])
+    elif name == 'POP':
+      regs[values[0]] = self.read_word(self.sp)
+      self.sp += 2
+    elif name == 'CALL':
+      self.lr = self.pc
+      self.pc = self.io + values[0]
+    elif name == 'RET':
+      self.pc = self.lr
+    elif name == 'RETI':
+      self.pc = self.lr
+      self.fl = self.read_word(self.sp)
+      self.lr = self.read_word(self.sp + 2)
+      self.sp += 4
+    elif name in ('BO', 'BA'):
+      flag = CONDITION_INDEX[condition]
+      if flag == 0 or [None, self.z, not self.z, self.c, self.v, self.n, self.p][flag]:
+        target = self.pc + values[0] if name == 'BO' else self.io + values[0]
+        if target & 0x1:
+          raise ValueError("Jumped to uneven address; not supported!")
+        if target > 0xFFFF or target < 0x0000:
+          raise ValueError("PC out of range, jumped too far.")
+        self.pc = target
+    # NOP and unknown instructions do nothing
+
+def _random_line(rng, remaining):
+  """One random instruction; a forward branch skips at most `remaining` lines."""
+  kind = rng.randrange(10)
+  ra, rb = rng.choice(REGISTERS), rng.choice(REGISTERS + [COUNTER])
+  if kind == 0:
+    operand = rb if rng.random() < 0.5 else f"#{rng.randrange(-32, 32)}"
+    return f"{rng.choice(['ADD', 'ADC', 'SUB'])} {ra}, {operand}"
+  if kind == 1:
+    return f"{rng.choice(['AND', 'OR', 'XOR', 'SLL', 'SRL', 'SRA'])} {ra}, {rb}"
+  if kind == 2:
+    return rng.choice([f"NOT {ra}", f"MV {ra}, {rb}", f"SET {rb}", "NOP"])
+  if kind == 3:
+    imm = rng.randrange(-64, 64) * 2 + (rng.random() < 0.1)
+    return f"{rng.choice(['LB', 'LW', 'SB', 'SW', 'TAS'])} {ra}, #{imm}"
+  if kind == 4:
+    return f"{rng.choice(['MVL', 'MVH'])} {ra}, #{rng.randrange(-128, 128)}"
+  if kind == 5:
+    return rng.choice([f"PUSH {rb}", f"POP {ra}"])
+  if kind in (6, 7):
+    # forward offsets only; they may land just past the end of the program
+    offset = rng.randrange(0, min(2 * remaining, 126) + 1, 2) + (rng.random() < 0.05)
+    return f"BO{rng.choice(CONDITIONS)} #{offset}"
+  if kind == 8:
+    # IO always points into RAM, so CALL/BA leave the program for good
+    return f"{rng.choice(['BA' + c for c in CONDITIONS] + ['CALL'])} #{rng.randrange(-64, 64) * 2}"
+  return "RET"
+
+def random_program(rng, length):
+  """Random valid program as assembly lines.
+
+  Branches only go forward, except for the loops: MVL/MVH load R11 with 1 to
+  MAX_ITERATIONS, and SUB R11 / SET R11 / BO.P jumps back over a body that
+  does not write R11. A branch into a body finds R11 at 0 (its initial
+  value and the value every loop leaves) or at a smaller count, so every
+  program terminates.
+  """
+  lines = []
+  while len(lines) < length:
+    if rng.random() < 0.1 and len(lines) + 6 <= length:
+      body = [_random_line(rng, 0) for _ in range(rng.randrange(1, min(length - len(lines) - 5, 6) + 1))]
+      body = [line for line in body if not line.startswith(('BO', 'BA', 'CALL', 'RET'))] or ["NOP"]
+      lines += [f"MVL {COUNTER}, #{rng.randrange(1, MAX_ITERATIONS + 1)}", f"MVH {COUNTER}, #0"] + body
+      lines += [f"SUB {COUNTER}, #1", f"SET {COUNTER}", f"BO.P #{-2 * (len(body) + 3)}"]
+    else:
+      lines.append(_random_line(rng, length - len(lines)))
+  return lines
+
+def random_state(rng):
+  state = {name: rng.choice([0, 1, 0x7FFF, 0x8000, 0xFFFF, rng.randrange(0x10000)]) for name in REGISTERS}
+  state['IO'] = rng.randrange(0x4100, 0x7F00, 2)
+  state['LR'] = 0xFFF6  # RET before any CALL leaves the program
+  state['FL'] = rng.randrange(0x20)
+  return state
+
+def assemble(lines):
+  return [assembler.assemble_instruction(line) for line in lines]
+
+def _setup(machine, words, state):
+  for i, word in enumerate(words):
+    machine.write_word(2*i, word)
+  for name, value in state.items():
+    machine.registers[REGISTER_INDEX[name]] = value
+
+def _form(word):
+  """Mnemonic and operand kinds of a word, e.g. 'SUB rA, #imm'."""
+  text = reference_disassemble(word)
+  if text is None:
+    return f"0x{word:04X}"
+  mnemonic, _, rest = text.partition(' ')
+  operands = ['#imm' if op.strip().startswith('#') else 'r' for op in rest.split(',')] if rest else []
+  return ' '.join([mnemonic] + [', '.join(operands)]).strip()
+
+def _run_alone(model, end, ttl):
+  """Step model with its own fetches until it leaves the program or raises; returns whether it did within ttl."""
+  for _ in range(ttl):
+    if not 0 <= model.pc < end:
+      return True
+    try:
+      model.decode_and_execute(model.fetch())
+    except Exception:
+      return True
+  return not 0 <= model.pc < end
+
+def run_case(lines, state, ttl_factor=4):
+  """Run one case; returns a failure signature tuple, or None if the CPU behaved."""
+  words = assemble(lines)
+  for word in words:
+    text = reference_disassemble(word)
+    try:
+      again = assembler.assemble_instruction(text) if text else None
+    except (KeyError, ValueError):
+      again = None
+    if again != word:
+      return ('roundtrip', _form(word))
+
+  # a generated program runs each instruction at most MAX_ITERATIONS times per loop; ttl_factor is slack
+  end = 2 * len(words)
+  ttl = ttl_factor * len(words) * (MAX_ITERATIONS * (lines.count(f"SET {COUNTER}") + 1))
+  machine = cpu.CPU()
+  _setup(machine, words, state)
+  if not _run_alone(machine, end, ttl):
+    reference = ReferenceCPU()
+    _setup(reference, words, state)
+    return ('hang', None) if _run_alone(reference, end, ttl) else None
+
+  machine, reference = cpu.CPU(), ReferenceCPU()
+  _setup(machine, words, state)
+  _setup(reference, words, state)
+  for _ in range(ttl):
+    if not 0 <= reference.pc < end:
+      if bytes(machine.memory) != bytes(reference.memory):
+        return ('divergence', 'memory')
+      return None
+    word = reference.fetch()
+    errors = []
+    for model in (machine, reference):
+      try:
+        model.decode_and_execute(word)
+        errors.append(None)
+      except Exception as e:
+        errors.append(type(e).__name__)
+    if errors[0] != errors[1]:
+      return ('exception', errors[0] or 'none', _form(word))
+    if errors[0]:
+      return None  # both trap: the program itself is invalid
+    if machine.registers != reference.registers:
+      return ('divergence', _form(word))
+  return None  # the reference did not terminate either
+
+def shrink(lines, state, signature):
+  """Delta-debug a failing case down to a minimal program and initial state."""
+  chunk = len(lines) // 2
+  while chunk >= 1:
+    i = 0
+    while i < len(lines):
+      candidate = lines[:i] + lines[i + chunk:]
+      if candidate and run_case(candidate, state) == signature:
+        lines = candidate
+      else:
+        i += chunk
+    chunk //= 2
+
+  # simplify the initial state as far as the failure allows
+  for name in REGISTERS + ['FL']:
+    if state.get(name):
+      candidate = dict(state, **{name: 0})
+      if run_case(lines, candidate) == signature:
+        state = candidate
+  return lines, state
+
+def run_batch(args):
+  """Worker: run `count` cases from `seed`; returns (count, {signature: [hits, lines, state]})."""
+  seed, count, length = args
+  rng = random.Random(seed)
+  failures = {}
+  for _ in range(count):
+    lines = random_program(rng, rng.randrange(1, length + 1))
+    state = random_state(rng)
+    signature = run_case(lines, state)
+    if signature is None:
+      continue
+    if signature in failures:
+      failures[signature][0] += 1
+    else:
+      failures[signature] = [1, *shrink(lines, state, signature)]
+  return count, failures
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='stress.py', description='random-instruction stress test of the cpu')
+  parser.add_argument('--programs', type=int, default=20000)
+  parser.add_argument('--workers', type=int, default=os.cpu_count())
+  parser.add_argument('--batch', type=int, default=250)
+  parser.add_argument('--length', type=int, default=24, help='max instructions per program')
+  parser.add_argument('--seed', type=int, default=0)
+  args = parser.parse_args(argv)
+
+  batches = [(args.seed * 1000003 + i, min(args.batch, args.programs - i * args.batch), args.length)
+             for i in range((args.programs + args.batch - 1) // args.batch)]
+  failures = {}
+  done = 0
+  start = time.perf_counter()
+  with multiprocessing.Pool(args.workers) as pool:
+    for count, batch_failures in pool.imap_unordered(run_batch, batches):
+      done += count
+      for signature, (hits, lines, state) in batch_failures.items():
+        if signature not in failures:
+          failures[signature] = [0, lines, state]
+        elif len(lines) < len(failures[signature][1]):
+          failures[signature][1:] = [lines, state]
+        failures[signature][0] += hits
+  elapsed = time.perf_counter() - start
+
+  print(f"{done} programs in {elapsed:.1f}s ({done / elapsed * 60:.0f} programs/min, {args.workers} workers)")
+  for signature, (hits, lines, state) in sorted(failures.items(), key=lambda item: -item[1][0]):
+    print(f"\n{cpu.colored('[fail]', 31)} {' '.join(str(s) for s in signature if s)}: {hits} programs")
+    print("  state: " + ', '.join(f"{name}=0x{value:04X}" for name, value in state.items() if value))
+    for line in lines:
+      print(f"    {line}")
+  return 1 if failures else 0
+
+if __name__ == "__main__":
+  cpu.color = sys.stdout.isatty()
+  sys.exit(main())